@@ -9,8 +9,24 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.wsgi import WsgiToAsgi
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from config.wsgi import application as wsgi_application
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# WhiteNoise is WSGI only. As a middleware it would run every request in a
+# thread, so only static files go through it (see config.wsgi) and the
+# views keep a fully async middleware chain.
+static_application = WsgiToAsgi(wsgi_application)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"].startswith(settings.STATIC_URL):
+        await static_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
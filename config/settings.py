@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 from pathlib import Path
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,8 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',  # first, so it measures everything below
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # no WhiteNoiseMiddleware: it is sync only and would put every ASGI request on a
+    # thread; config.wsgi wraps the app in WhiteNoise and config.asgi hands it /static/
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,7 +64,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the Django backend plus render timings for QueryBudgetMiddleware
+        'BACKEND': 'core.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,6 +78,49 @@ TEMPLATES = [
     },
 ]
 
+# Maximum SQL queries per request, by URL name (see core.middleware)
+QUERY_BUDGETS = {
+    "match_list": 10,
+    "offer_list": 10,
+    "accept_offer": 15,
+    "signup_slot": 15,
+}
+# raise instead of logging when a view goes over budget (turn on in CI)
+QUERY_BUDGET_RAISE = os.getenv("QUERY_BUDGET_RAISE", "False") == "True"
+
+# Cache
+# Cached data is invalidated by bumping version stamps in the cache itself, so
+# every process that writes (web workers, management commands) must share one
+# backend. The default is a directory on this machine; with several machines use
+# CACHE_URL=redis://localhost:6379/0 (or file:///shared/path).
+# CACHE_URL=locmem:// keeps the cache in process memory, for a single process only.
+CACHE_URL = os.getenv("CACHE_URL", "file://" + os.path.join(tempfile.gettempdir(), "volunteer-app-cache"))
+if CACHE_URL.startswith("redis://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith("file://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": CACHE_URL.removeprefix("file://"),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+elif CACHE_URL == "locmem://":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "volunteer-app",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unsupported CACHE_URL {CACHE_URL!r}.")
+
 LOGIN_REDIRECT_URL = "match_list"  # after login
 LOGOUT_REDIRECT_URL = "match_list"  # after logout
 
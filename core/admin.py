@@ -1,27 +1,92 @@
-from django.contrib import admin
-from .models import Match, VolunteerSlot, HomeTeam, Profile
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.auth.models import User
+from .models import Match, VolunteerSlot, HomeTeam, Profile, QueuedEmail
+from .services import SlotUnavailable, reassign_slots
+
+# The slot and user tables run into the thousands: every foreign key is either
+# selected with the rows or picked through an autocomplete widget, and no
+# filter lists all users or matches in the sidebar.
+
+
+class VolunteerSlotInline(admin.TabularInline):
+    model = VolunteerSlot
+    extra = 0
+    autocomplete_fields = ('volunteer',)
 
 
 @admin.register(Match)
 class MatchAdmin(admin.ModelAdmin):
-    list_display = ('date', 'start_time', 'home_team', 'guest_team', 'location')
-    list_filter = ('date', 'location', 'home_team')
+    list_display = ('date', 'start_time', 'home_team', 'guest_team', 'location', 'occupancy')
+    list_filter = ('location', 'home_team')
+    list_select_related = ('home_team',)
+    date_hierarchy = 'date'
     search_fields = ('home_team__name', 'guest_team')
+    autocomplete_fields = ('home_team',)
+    inlines = (VolunteerSlotInline,)
+
+    @admin.display(description='Volunteers', ordering='filled_slots')
+    def occupancy(self, obj):
+        return f"{obj.filled_slots}/{obj.capacity}"
+
+
+class VolunteerActionForm(ActionForm):
+    # a username rather than a select, which would list every user
+    username = forms.CharField(required=False, label='Volunteer (username)')
 
 
 @admin.register(VolunteerSlot)
 class VolunteerSlotAdmin(admin.ModelAdmin):
     list_display = ('match', 'volunteer')
-    list_filter = ('match', 'volunteer')
+    list_filter = (('volunteer', admin.EmptyFieldListFilter), 'match__home_team')
+    list_select_related = ('match__home_team', 'volunteer')
+    date_hierarchy = 'match__date'
+    search_fields = ('volunteer__username', 'match__home_team__name', 'match__guest_team')
+    autocomplete_fields = ('match', 'volunteer')
+    action_form = VolunteerActionForm
+    actions = ('assign_volunteer', 'clear_volunteers')
+    # skips a COUNT(*) of the whole table on every filtered page
+    show_full_result_count = False
+
+    @admin.action(description='Assign the selected slots to the volunteer above')
+    def assign_volunteer(self, request, queryset):
+        username = request.POST.get('username', '').strip()
+        user = User.objects.filter(username=username).first() if username else None
+        if user is None:
+            self.message_user(request, f"No user named {username!r}.", messages.ERROR)
+            return
+        try:
+            updated = reassign_slots(queryset.values_list('pk', flat=True), user)
+        except SlotUnavailable as exc:
+            self.message_user(request, str(exc), messages.ERROR)
+            return
+        self.message_user(request, f"Assigned {updated} slot(s) to {user.username}.", messages.SUCCESS)
+
+    @admin.action(description='Clear the volunteers of the selected slots')
+    def clear_volunteers(self, request, queryset):
+        updated = reassign_slots(queryset.filter(volunteer__isnull=False).values_list('pk', flat=True))
+        self.message_user(request, f"Cleared {updated} slot(s).", messages.SUCCESS)
 
 
 @admin.register(HomeTeam)
 class HomeTeamAdmin(admin.ModelAdmin):
     list_display = ('name',)
+    search_fields = ('name',)
 
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'home_team')
     list_filter = ('home_team',)
+    list_select_related = ('user', 'home_team')
+    search_fields = ('user__username', 'user__email', 'home_team__name')
+    autocomplete_fields = ('user', 'home_team')
+    show_full_result_count = False
+
 
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
@@ -0,0 +1,112 @@
+"""
+Read-only JSON API for scoreboard displays and the mobile app.
+
+Every response carries a strong ETag derived from the version stamps of the
+data it contains (see core.cache), so a client polling with If-None-Match
+gets a 304 without a single query or any serialization. Bodies are cached
+under the same stamps, so a 200 for unchanged data is cheap too.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+
+from .cache import cached, get_versions, versioned_key
+from .models import Match, Offer
+from .schedule import schedule_rows, schedule_versions
+
+
+def api_login_required(view):
+    """login_required for API clients: a 401 instead of a redirect to the login page."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Authentication required."}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _json_response(request, kind, key, versions, build, private=False):
+    etag = '"%s"' % hashlib.md5(versioned_key(kind, key, versions).encode()).hexdigest()
+    last_modified = int(max(versions.values()))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        body = cached(kind, key, versions, lambda: json.dumps(build(), cls=DjangoJSONEncoder, separators=(",", ":")))
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # clients may keep the body but must check back with the ETag every time
+    response["Cache-Control"] = "private, no-cache" if private else "public, no-cache"
+    if private:
+        patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+@require_GET
+def matches(request):
+    """Upcoming matches with their slot occupancy, optionally for one home team (?team=<id>)."""
+    team = request.GET.get("team", "")
+    if team and not team.isdigit():
+        return JsonResponse({"error": "team must be a team id."}, status=400)
+    today = timezone.localdate()
+
+    def build():
+        rows = Match.objects.filter(date__gte=today)
+        if team:
+            rows = rows.filter(home_team_id=team)
+        rows = (
+            rows.annotate(filled=F("filled_slots"), home_team_name=F("home_team__name"))
+            .order_by("date", "start_time", "id")
+            .values("id", "date", "start_time", "home_team_id", "home_team_name", "guest_team",
+                    "location", "filled", "capacity")
+        )
+        return {"matches": list(rows)}
+
+    # the day is part of the key: matches drop out of "upcoming" without any write
+    versions = get_versions(["calendar"])
+    return _json_response(request, "api:matches", f"{today}:{team}", versions, build)
+
+
+@require_GET
+@api_login_required
+def offers(request):
+    """Open trade and time-swap offers."""
+    def build():
+        rows = (
+            Offer.objects.filter(status="open")
+            .order_by("-created_at", "-id")
+            .values("id", "type", "created_at", "slot_id")
+            .annotate(
+                user=F("user__username"),
+                match_id=F("slot__match_id"),
+                date=F("slot__match__date"),
+                start_time=F("slot__match__start_time"),
+                home_team_name=F("slot__match__home_team__name"),
+                guest_team=F("slot__match__guest_team"),
+            )
+        )
+        return {"offers": list(rows)}
+
+    versions = get_versions(["offers", "calendar"])
+    return _json_response(request, "api:offers", "open", versions, build, private=True)
+
+
+@require_GET
+@api_login_required
+def my_assignments(request):
+    """The signed-in user's upcoming slots, with the open offers on them."""
+    user_id = request.user.pk
+    today = timezone.localdate()
+
+    def build():
+        return {"assignments": schedule_rows(user_id, today)}
+
+    versions = schedule_versions(user_id)
+    return _json_response(request, "api:assignments", f"{user_id}:{today}", versions, build, private=True)
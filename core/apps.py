@@ -4,5 +4,5 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
-def ready(self):
-    import core.signals
+    def ready(self):
+        import core.signals
@@ -0,0 +1,247 @@
+"""
+Fair-share assignment of open volunteer slots.
+
+Every open slot in a date range, up to each match's capacity, goes to an
+eligible user: not playing in the match (the home_team rule of signup and
+accept_offer) and not already in it. A user may take many slots, and the
+loads (slots held in the range, existing ones included) should be as even as
+possible.
+
+This is a semi-matching problem. A least-loaded greedy pass fills the slots,
+then cost-reducing paths move new assignments away from the busiest users:
+u gives match m0 to v1, v1 hands one of its new matches m1 on to v2, ... and
+the last user, who is at least two slots below u, ends up with one more. When
+no such path is left the assignment is optimal for any convex cost of the
+loads (Harvey et al., "Semi-matchings for bipartite graphs and load
+balancing"): the busiest user is as little busy as possible, and so on down.
+With a per-user cap the same paths reach users below the cap for slots the
+greedy pass couldn't fill.
+
+Paths are searched up to MAX_HANDOVERS steps. Only players are ever
+ineligible, so nearly every improvement is a direct move and longer paths
+only cost time; the result is optimal among moves of that length.
+"""
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .cache import invalidate
+from .events import slot_event
+from .models import Match, VolunteerSlot
+from .services import reserve_capacity
+
+MAX_HANDOVERS = 3
+
+
+@dataclass
+class AssignmentPlan:
+    assignments: dict = field(default_factory=dict)  # slot id -> user id
+    unfilled: list = field(default_factory=list)  # slot ids nobody could take
+    loads_before: dict = field(default_factory=dict)  # user id -> slots held in the range
+    loads_after: dict = field(default_factory=dict)
+
+
+class Solver:
+    """
+    ``matches`` maps match id -> (home team id, guest team name, [(slot id, volunteer id or None)]);
+    ``users`` maps user id -> (home team id, home team name), both may be None.
+    """
+
+    def __init__(self, matches, users, max_per_user=None):
+        self.matches = matches
+        self.users = users
+        self.cap = max_per_user
+        self.members = {m: {v for slot, v in slots if v} for m, (home, guest, slots) in matches.items()}
+        self.load = dict.fromkeys(users, 0)
+        for volunteers in self.members.values():
+            for v in volunteers:
+                if v in self.load:
+                    self.load[v] += 1
+        self.buckets = defaultdict(set)  # load -> users, to find the least loaded quickly
+        for u, load in self.load.items():
+            self.buckets[load].add(u)
+        self.assigned = defaultdict(set)  # user -> matches given to them by the solver (movable)
+
+    def eligible(self, u, m):
+        home, guest, slots = self.matches[m]
+        team_id, team_name = self.users[u]
+        return u not in self.members[m] and not (team_id and (team_id == home or team_name == guest))
+
+    def least_loaded(self, m, limit, skip=()):
+        for load in sorted(load for load, users in self.buckets.items() if users and load <= limit):
+            for u in self.buckets[load]:
+                if u not in skip and self.eligible(u, m):
+                    return u
+        return None
+
+    def set_load(self, u, load):
+        self.buckets[self.load[u]].discard(u)
+        self.load[u] = load
+        self.buckets[load].add(u)
+
+    def take(self, u, m):
+        self.members[m].add(u)
+        self.assigned[u].add(m)
+        self.set_load(u, self.load[u] + 1)
+
+    def release(self, u, m):
+        self.members[m].discard(u)
+        self.assigned[u].discard(m)
+        self.set_load(u, self.load[u] - 1)
+
+    def find_path(self, start, limit, skip=()):
+        """
+        Alternating path from match ``start`` to a user with load <= ``limit``.
+
+        Returns [(user, match they take), ...] starting with that user; every
+        later user hands on the match taken by the one before, and the last
+        one takes ``start``. Only the first user's load grows.
+        """
+        if not any(users for load, users in self.buckets.items() if load <= limit):
+            return None  # nobody is that little loaded, no need to search
+        parent = {start: None}
+        seen_users = set(skip)
+        queue = deque([(start, 0)])
+        while queue:
+            m, depth = queue.popleft()
+            last = self.least_loaded(m, limit, seen_users)
+            if last is not None:
+                path = [(last, m)]
+                while parent[m] is not None:
+                    u, m = parent[m]
+                    path.append((u, m))
+                return path
+            if depth == MAX_HANDOVERS:
+                continue
+            # someone eligible for m could take it and pass one of their new matches on
+            for u, matches in self.assigned.items():
+                if not matches or u in seen_users or not self.eligible(u, m):
+                    continue
+                seen_users.add(u)
+                for handed_on in matches:
+                    if handed_on not in parent:
+                        parent[handed_on] = (u, m)
+                        queue.append((handed_on, depth + 1))
+        return None
+
+    def solve(self):
+        limit = float("inf") if self.cap is None else self.cap - 1
+        slots_by_match = {m: [slot for slot, v in slots if v is None] for m, (home, guest, slots) in self.matches.items()}
+        unfilled_matches = []
+
+        for m, open_slots in slots_by_match.items():
+            for _ in open_slots:
+                u = self.least_loaded(m, limit)
+                if u is None and self.cap is not None:
+                    path = self.find_path(m, limit)
+                    if path:
+                        self.move_along(path)
+                        continue
+                if u is None:
+                    unfilled_matches.append(m)
+                else:
+                    self.take(u, m)
+
+        self.balance()
+
+        plan = AssignmentPlan(loads_after=dict(self.load))
+        plan.loads_before = {u: load - len(self.assigned[u]) for u, load in self.load.items()}
+        takers = defaultdict(list)
+        for u, matches in self.assigned.items():
+            for m in matches:
+                takers[m].append(u)
+        for m, open_slots in slots_by_match.items():
+            for slot, u in zip(open_slots, sorted(takers[m])):
+                plan.assignments[slot] = u
+            plan.unfilled += open_slots[len(takers[m]):]
+        return plan
+
+    def move_along(self, path):
+        """Apply a path from find_path()."""
+        first, m = path[0]
+        self.take(first, m)
+        for (previous, handed_on), (u, m) in zip(path, path[1:]):
+            self.release(u, handed_on)
+            self.take(u, m)
+
+    def balance(self):
+        """Apply cost-reducing paths, busiest users first, until there are none."""
+        improved = True
+        while improved:
+            improved = False
+            for u in sorted(self.assigned, key=self.load.get, reverse=True):
+                for m in list(self.assigned[u]):
+                    path = self.find_path(m, self.load[u] - 2, skip=(u,))
+                    if path:
+                        self.release(u, m)
+                        self.move_along(path)
+                        improved = True
+                        break
+
+
+def load_problem(start, end):
+    """Matches of the range with their slots, and the users who could volunteer, in three queries."""
+    matches, open_left = {}, {}
+    for match_id, home_id, guest, open_slots in (
+        Match.objects.filter(date__range=(start, end)).order_by("date", "start_time", "id")
+        .values_list("id", "home_team_id", "guest_team", "open_slots")
+    ):
+        matches[match_id] = (home_id, guest, [])
+        open_left[match_id] = open_slots
+    for slot_id, match_id, volunteer_id in (
+        VolunteerSlot.objects.filter(match_id__in=matches).order_by("id").values_list("id", "match_id", "volunteer_id")
+    ):
+        # slots beyond the match's capacity are left alone
+        if volunteer_id is None:
+            if not open_left[match_id]:
+                continue
+            open_left[match_id] -= 1
+        matches[match_id][2].append((slot_id, volunteer_id))
+    users = {
+        u["id"]: (u["profile__home_team_id"], u["profile__home_team__name"])
+        for u in User.objects.filter(is_active=True, is_staff=False)
+        .values("id", "profile__home_team_id", "profile__home_team__name")
+    }
+    return matches, users
+
+
+def plan_assignments(start, end, max_per_user=None):
+    matches, users = load_problem(start, end)
+    return Solver(matches, users, max_per_user).solve()
+
+
+def apply_plan(plan):
+    """
+    Save a plan. Slots that were taken since the plan was made are skipped,
+    and so are assignments to matches that filled up meanwhile. Returns the
+    number of slots assigned.
+    """
+    assigned = set()
+    with transaction.atomic():
+        match_ids = dict(VolunteerSlot.objects.filter(pk__in=plan.assignments).values_list("id", "match_id"))
+        for slot_id, user_id in plan.assignments.items():
+            try:
+                # a savepoint each, so one conflict doesn't undo the rest
+                with transaction.atomic():
+                    # counted first, like claim_slot(), which also locks the match against concurrent claims
+                    if slot_id not in match_ids or not reserve_capacity(match_ids[slot_id]):
+                        continue
+                    if VolunteerSlot.objects.filter(pk=slot_id, volunteer__isnull=True).update(volunteer_id=user_id):
+                        assigned.add(slot_id)
+                    else:
+                        transaction.set_rollback(True)  # and with it the count
+            except IntegrityError:
+                # the user signed up for that match in the meantime
+                pass
+        # queryset updates send no signals
+        matches, volunteers = set(), set()
+        for slot_id, match_id, volunteer_id in VolunteerSlot.objects.filter(pk__in=assigned).values_list(
+            "id", "match_id", "volunteer_id"
+        ):
+            matches.add(match_id)
+            volunteers.add(volunteer_id)
+            slot_event(slot_id, match_id, volunteer_id)
+        invalidate("calendar", *(f"match:{m}" for m in matches), *(f"volunteer:{u}" for u in volunteers))
+    return len(assigned)
@@ -0,0 +1,100 @@
+"""
+Cached building blocks of the match board (match_list).
+
+The parts of the page that are the same for every visitor are cached:
+which matches are on a page, the team dropdown, and one rendered card per
+match. Each card is keyed by its match's version stamp, bumped whenever the
+match or one of its slots changes (see core.signals and core.services), so a
+card is re-rendered only after something on it changed. The view then
+overlays the per-user bits from the user's own slots.
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import date, time
+
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.template.loader import render_to_string
+
+from .cache import cached, cached_many, get_versions
+from .models import Match, VolunteerSlot
+from .pagination import keyset_page
+
+
+@dataclass
+class MatchCard:
+    id: int
+    date: date
+    start_time: time
+    home_team_id: int
+    guest_team: str
+    num_volunteers: int
+    open_slot_id: int | None
+    html: str
+
+
+def you_marker(user_id):
+    # left in the shared card after a volunteer's name; the overlay turns the
+    # viewer's own marker into "(you)" and the rest stay invisible comments
+    return f"<!--you:{user_id}-->"
+
+
+def page_match_ids(matches, ordering, cursor, page_size, cache_key=None, versions=("schedule",)):
+    """
+    Ids of the matches on one page plus the cursor of the next page.
+
+    Pass ``cache_key`` for listings that are the same for everyone; the
+    result is then cached until one of ``versions`` is bumped: the schedule,
+    plus the calendar for listings that depend on who volunteers.
+    """
+    def build():
+        objects, next_cursor = keyset_page(matches.only(*(f.lstrip("-") for f in ordering)), ordering, cursor, page_size)
+        return [match.id for match in objects], next_cursor
+
+    if cache_key is None:
+        return build()
+    # filter values are user input: hash them into a safe key
+    digest = hashlib.md5(f"{cache_key}|{cursor or ''}".encode()).hexdigest()
+    return cached("board:page", digest, get_versions(list(versions)), build)
+
+
+def team_names():
+    def build():
+        return list(Match.objects.values_list("home_team__name", flat=True).distinct().order_by("home_team__name"))
+
+    return cached("board:teams", "all", get_versions(["schedule", "teams"]), build)
+
+
+def match_cards(match_ids):
+    """Cards for the given matches, in order, rendering only the ones that changed."""
+    versions = get_versions([f"match:{pk}" for pk in match_ids] + ["teams"])
+    cards = cached_many(
+        "board:card",
+        {pk: {"match": versions[f"match:{pk}"], "teams": versions["teams"]} for pk in match_ids},
+        lambda missing: {card.id: card for card in _build_cards(missing)},
+    )
+    return [cards[pk] for pk in match_ids if pk in cards]
+
+
+def _build_cards(match_ids):
+    open_slots = VolunteerSlot.objects.filter(match=OuterRef("pk"), volunteer__isnull=True).order_by("id")
+    matches = (
+        Match.objects.filter(pk__in=match_ids)
+        .select_related("home_team")
+        .annotate(open_slot_id=Subquery(open_slots.values("id")[:1]))
+        .prefetch_related(
+            Prefetch("slots", queryset=VolunteerSlot.objects.select_related("volunteer").order_by("id"))
+        )
+    )
+    for match in matches:
+        html = render_to_string("core/_match_card.html", {"match": match})
+        yield MatchCard(
+            id=match.id,
+            date=match.date,
+            start_time=match.start_time,
+            home_team_id=match.home_team_id,
+            guest_team=match.guest_team,
+            num_volunteers=match.filled_slots,
+            # a full match may still have spare slot rows, e.g. after its capacity was lowered
+            open_slot_id=match.open_slot_id if match.open_slots else None,
+            html=html,
+        )
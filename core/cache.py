@@ -0,0 +1,148 @@
+"""
+Versioned caching on top of whatever backend settings.CACHES configures.
+
+Cached values are keyed by the version stamps of the data they were built
+from. The stamps are bumped from the model signals in core.signals (and by
+hand after queryset updates, which send no signals):
+
+    Match          "schedule", "calendar", "match:<id>"
+    VolunteerSlot  "calendar", "match:<match id>", "volunteer:<user id>"
+    HomeTeam       "teams", "calendar"
+    Offer          "offers", "volunteer:<user id>"
+    User (rename)  "calendar", "offers", "volunteer:<id>", "match:<id>" of their slots
+
+"volunteer:<user id>" covers one user's own slots and offers (core.schedule);
+a slot that changes hands bumps it for both the old and the new volunteer.
+
+A bump makes every key built from the old stamp unreachable, so nothing has
+to be found and deleted, and a value is never served after a write to the
+rows it depends on.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+_missing = object()
+
+
+class CacheStats:
+    """Hits and misses per kind of cached value, kept in process memory."""
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add(self, kind, hits=0, misses=0):
+        with self.lock:
+            counts = self.counts.setdefault(kind, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+
+    def summary(self):
+        with self.lock:
+            counts = {kind: tuple(values) for kind, values in self.counts.items()}
+        return {
+            kind: {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+            for kind, (hits, misses) in sorted(counts.items())
+        }
+
+
+cache_stats = CacheStats()
+
+
+def get_versions(names):
+    """
+    Current version stamps of several groups of cached data, in one cache round trip.
+
+    A stamp is the time of the last change, so it doubles as a Last-Modified
+    value. Cache keys that embed it go stale as soon as the version is
+    bumped, without having to find and delete them.
+    """
+    keys = {name: f"version:{name}" for name in names}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for name, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = time.time()
+            # add() so two processes starting at once agree on one stamp
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        versions[name] = version
+    return versions
+
+
+def get_version(name):
+    return get_versions([name])[name]
+
+
+def bump_versions(names):
+    now = time.time()
+    cache.set_many({f"version:{name}": now for name in names}, timeout=None)
+
+
+def bump_version(name):
+    bump_versions([name])
+
+
+def invalidate(*names):
+    """
+    Mark cached data stale: now, and again once the current transaction commits.
+
+    The first bump makes the change visible to this transaction; the second
+    one drops anything a concurrent request cached from the old rows in the
+    meantime.
+    """
+    bump_versions(names)
+    transaction.on_commit(lambda: bump_versions(names))
+
+
+def versioned_key(kind, key, versions):
+    stamps = ":".join(repr(versions[name]) for name in sorted(versions))
+    return f"{kind}:{key}:{stamps}"
+
+
+def cached(kind, key, versions, build, timeout=CACHE_TIMEOUT):
+    """
+    Return the cached value of ``kind:key``, calling ``build()`` on a miss.
+
+    ``versions`` are the stamps the value depends on, as returned by
+    get_versions().
+    """
+    cache_key = versioned_key(kind, key, versions)
+    value = cache.get(cache_key, _missing)
+    if value is not _missing:
+        cache_stats.add(kind, hits=1)
+        return value
+    cache_stats.add(kind, misses=1)
+    value = build()
+    cache.set(cache_key, value, timeout)
+    return value
+
+
+def cached_many(kind, versions_by_key, build, timeout=CACHE_TIMEOUT):
+    """
+    Like cached() for several values in one round trip.
+
+    ``versions_by_key`` maps each key to the stamps its value depends on;
+    ``build(missing_keys)`` returns a dict with the values that weren't
+    cached. Keys that build() leaves out are left out of the result.
+    """
+    cache_keys = {key: versioned_key(kind, key, versions) for key, versions in versions_by_key.items()}
+    found = cache.get_many(cache_keys.values())
+    values = {key: found[cache_key] for key, cache_key in cache_keys.items() if cache_key in found}
+    missing = [key for key in cache_keys if key not in values]
+    cache_stats.add(kind, hits=len(values), misses=len(missing))
+    if missing:
+        fresh = build(missing)
+        cache.set_many({cache_keys[key]: value for key, value in fresh.items()}, timeout)
+        values.update(fresh)
+    return values
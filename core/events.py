@@ -0,0 +1,116 @@
+"""
+Live slot and offer events, pushed to browsers with server-sent events.
+
+Writes publish small events (slot-claimed, slot-freed, offer-opened) once
+their transaction commits; the broker hands each one to every open stream,
+so an event costs one queue put per subscriber instead of every browser
+polling the match board.
+
+The broker lives in process memory: a browser only hears about writes made
+by the worker process serving its stream. Streams need an ASGI server
+(config.asgi), a WSGI worker would be tied up by each of them.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+
+from django.db import transaction
+
+HISTORY = 200  # events kept for clients reconnecting with Last-Event-ID
+QUEUE_SIZE = 100  # a subscriber this far behind is disconnected and resumes from the history
+HEARTBEAT = 15  # seconds between keepalive comments, so proxies don't drop idle streams
+RETRY_MS = 5000
+
+
+class Subscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+    """In-process fan-out of events to the open streams."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.history = deque(maxlen=HISTORY)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def publish(self, kind, data):
+        """Send an event to every subscriber; safe to call from any thread."""
+        with self.lock:
+            event = (next(self.ids), kind, data)
+            self.history.append(event)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # its event loop is gone
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, last_id=None):
+        """
+        Register a subscriber on the running event loop.
+
+        Returns the subscription and the events after ``last_id`` that the
+        client missed, so that nothing falls between the two.
+        """
+        subscription = Subscription(asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(subscription)
+            missed = [event for event in self.history if last_id is not None and event[0] > last_id]
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+
+broker = Broker()
+
+
+def publish_on_commit(kind, **data):
+    transaction.on_commit(lambda: broker.publish(kind, data))
+
+
+def slot_event(slot_id, match_id, volunteer_id):
+    publish_on_commit(
+        "slot-claimed" if volunteer_id else "slot-freed",
+        slot_id=slot_id, match_id=match_id,
+    )
+
+
+def format_event(event):
+    event_id, kind, data = event
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def stream(last_id=None):
+    """The body of one event stream, replaying what the client missed first."""
+    subscription, missed = broker.subscribe(last_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for event in missed:
+            yield format_event(event)
+        # after an overflow the browser reconnects and resumes from the history
+        while not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+            else:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
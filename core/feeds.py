@@ -0,0 +1,83 @@
+import hashlib
+from datetime import datetime, time, timedelta
+
+from django.core import signing
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from .cache import cached, get_versions
+from .models import HomeTeam, Match, VolunteerSlot
+from .utils import calendar_for_slots, event_for_match, new_calendar
+
+# feeds only carry recent and upcoming events, so their size stays bounded
+FEED_HISTORY = timedelta(days=30)
+
+_signer = signing.Signer(salt="core.feeds.user")
+
+
+def user_feed_token(user):
+    """Secret part of a user's subscription URL; calendar clients can't log in."""
+    return _signer.sign(str(user.pk))
+
+
+def user_id_from_token(token):
+    try:
+        return int(_signer.unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def _cached_feed(key, since, build):
+    """
+    Return ``(body, etag, last_modified)`` for a feed, building it at most once per version.
+
+    All feeds share the "calendar" version, which is bumped whenever a match
+    or slot changes, so a cached body is never older than the data. The
+    window starts ``since``, which moves every day without any write, so it
+    is part of the key and the ETag, and the feed is modified at midnight
+    at the latest.
+    """
+    versions = get_versions(["calendar"])
+    midnight = timezone.make_aware(datetime.combine(since + FEED_HISTORY, time.min)).timestamp()
+
+    def build_entry():
+        body = build()
+        etag = hashlib.md5(body + since.isoformat().encode()).hexdigest()
+        return body, f'"{etag}"', int(max(versions["calendar"], midnight))
+
+    return cached("feed", f"{key}:{since}", versions, build_entry)
+
+
+def user_feed(user_id):
+    since = timezone.localdate() - FEED_HISTORY
+
+    def build():
+        slots = (
+            VolunteerSlot.objects.filter(volunteer_id=user_id, match__date__gte=since)
+            .select_related("match__home_team")
+            .order_by("match__date", "match__start_time")
+        )
+        return calendar_for_slots(slots, "My volunteering")
+
+    return _cached_feed(f"user:{user_id}", since, build)
+
+
+def team_feed(team_id):
+    since = timezone.localdate() - FEED_HISTORY
+
+    def build():
+        # only looked up on a cache miss; an unknown team is a 404
+        team = get_object_or_404(HomeTeam, pk=team_id)
+        matches = (
+            Match.objects.filter(home_team=team, date__gte=since)
+            .select_related("home_team")
+            .prefetch_related(Prefetch("slots", queryset=VolunteerSlot.objects.select_related("volunteer").order_by("id")))
+            .order_by("date", "start_time")
+        )
+        cal = new_calendar(f"{team.name} volunteering")
+        for match in matches:
+            cal.add_component(event_for_match(match))
+        return cal.to_ical()
+
+    return _cached_feed(f"team:{team_id}", since, build)
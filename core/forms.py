@@ -33,16 +33,14 @@ class CustomSignupForm(UserCreationForm):
         user.email = self.cleaned_data["email"]
         user.first_name = self.cleaned_data["first_name"]
         user.last_name = self.cleaned_data["last_name"]
+        # picked up by the post_save receiver that creates the profile
+        user._profile_defaults = {
+            "phone_number": self.cleaned_data.get("phone_number", ""),
+            "home_team": self.cleaned_data.get("home_team"),
+        }
 
         if commit:
             user.save()
-            # Save profile fields
-            profile = user.profile
-            profile.phone_number = self.cleaned_data.get("phone_number", "")
-            home_team = self.cleaned_data.get("home_team")
-            if home_team:
-                profile.home_team = home_team
-            profile.save()
         return user
 
 
@@ -61,7 +59,7 @@ class ProfileForm(forms.ModelForm):
 
     def save(self, commit=True):
         profile = super().save(commit=False)
-        if commit:
+        if commit and self.has_changed():
             profile.save()
         return profile
 
@@ -0,0 +1,115 @@
+"""
+Per-request timings: SQL queries, DB time and template render time.
+
+QueryBudgetMiddleware opens a RequestTimings for each request. Every database
+connection reports its queries into it (see record_query, installed from
+core.signals), and TimedDjangoTemplates reports template renders. A context
+variable carries the timings, so they follow the request into
+sync_to_async threads as well.
+"""
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates
+
+current_timings = ContextVar("current_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db_time += time.perf_counter() - start
+
+
+class TimedTemplate:
+    """Wraps a backend template so that its render time is recorded."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timings = current_timings.get()
+        if timings is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The regular Django template backend, with render times recorded."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestStats:
+    """Rolling window of the latest samples per URL name, kept in process memory."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, timings, total):
+        sample = (timings.queries, timings.db_time, timings.template_time, total)
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=self.window)).append(sample)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self):
+        with self.lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+
+        def ms(seconds):
+            return round(seconds * 1000, 2)
+
+        summary = {}
+        for name, values in sorted(samples.items()):
+            queries = [v[0] for v in values]
+            totals = sorted(v[3] for v in values)
+            summary[name] = {
+                "requests": len(values),
+                "queries_avg": round(sum(queries) / len(values), 2),
+                "queries_max": max(queries),
+                "db_ms_avg": ms(sum(v[1] for v in values) / len(values)),
+                "template_ms_avg": ms(sum(v[2] for v in values) / len(values)),
+                "total_ms_p50": ms(totals[len(totals) // 2]),
+                "total_ms_p95": ms(totals[min(len(totals) - 1, int(len(totals) * 0.95))]),
+                "total_ms_max": ms(totals[-1]),
+            }
+        return summary
+
+
+stats = RequestStats()
@@ -0,0 +1,113 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+# give up after this many attempts; the delay doubles after every failure
+MAX_ATTEMPTS = 6
+RETRY_DELAY = timedelta(minutes=1)
+
+
+def queue_email(subject, body, to, cc=(), attachments=(), from_email=None, key=None):
+    """
+    Put an email in the outbox instead of sending it on the request thread.
+
+    Call it inside the transaction that made the change the email is about:
+    if that transaction rolls back, the email is never sent. An email with a
+    ``key`` is queued at most once; a second one raises IntegrityError.
+    """
+    queued = new_queued_email(subject, body, to, cc, attachments, from_email, key)
+    queued.save()
+    return queued
+
+
+def new_queued_email(subject, body, to, cc=(), attachments=(), from_email=None, key=None):
+    """An unsaved outbox entry, for bulk_create when queueing many at once."""
+    return QueuedEmail(
+        key=key,
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+        cc=list(cc),
+        attachments=[
+            [filename, content.decode() if isinstance(content, bytes) else content, mimetype]
+            for filename, content, mimetype in attachments
+        ],
+    )
+
+
+def build_message(queued, connection=None):
+    email = EmailMessage(
+        queued.subject,
+        queued.body,
+        from_email=queued.from_email,
+        to=queued.to,
+        cc=queued.cc,
+        connection=connection,
+    )
+    for filename, content, mimetype in queued.attachments:
+        email.attach(filename, content, mimetype)
+    return email
+
+
+def send_queued_emails(batch_size=50):
+    """
+    Deliver up to ``batch_size`` due emails over a single connection.
+
+    Rows are locked with SKIP LOCKED so several workers can drain the outbox
+    side by side. A failed message is retried later with exponential backoff
+    and marked "failed" once it runs out of attempts. Returns (sent, failed).
+    """
+    now = timezone.now()
+    sent = failed = 0
+    with transaction.atomic():
+        batch = list(
+            QueuedEmail.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        if not batch:
+            return 0, 0
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as exc:
+            # the relay is down: nothing in this batch can go out
+            logger.warning("Could not connect to the mail server: %s", exc)
+            connection = None
+
+        for queued in batch:
+            queued.attempts += 1
+            try:
+                if connection is None:
+                    raise ConnectionError("mail server unavailable")
+                build_message(queued, connection).send(fail_silently=False)
+            except Exception as exc:
+                failed += 1
+                queued.last_error = str(exc)
+                if queued.attempts >= MAX_ATTEMPTS:
+                    queued.status = "failed"
+                    logger.error("Giving up on email %s after %s attempts: %s", queued.pk, queued.attempts, exc)
+                else:
+                    queued.next_attempt_at = now + RETRY_DELAY * 2 ** (queued.attempts - 1)
+            else:
+                sent += 1
+                queued.status = "sent"
+                queued.sent_at = timezone.now()
+                queued.last_error = ""
+
+        if connection is not None:
+            connection.close()
+        QueuedEmail.objects.bulk_update(
+            batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+        )
+    return sent, failed
@@ -0,0 +1,64 @@
+import time
+from collections import Counter
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.assignment import apply_plan, plan_assignments
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the open volunteer slots of a date range, spreading them as evenly as "
+        "possible over the users who may take them. Players never get a slot in their "
+        "own team's match. Use --dry-run to see the report without saving anything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="First match date (YYYY-MM-DD), default today.")
+        parser.add_argument("--until", required=True, help="Last match date (YYYY-MM-DD).")
+        parser.add_argument("--max-per-user", type=int,
+                            help="Don't give anyone slots beyond this many in the range.")
+        parser.add_argument("--dry-run", action="store_true", help="Report the plan without saving it.")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options["start"]) if options["start"] else timezone.localdate()
+            until = date.fromisoformat(options["until"])
+        except ValueError as exc:
+            raise CommandError(exc)
+        if until < start:
+            raise CommandError("--until is before --from.")
+        if options["max_per_user"] is not None and options["max_per_user"] < 1:
+            raise CommandError("--max-per-user must be at least 1.")
+
+        started = time.perf_counter()
+        plan = plan_assignments(start, until, options["max_per_user"])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{len(plan.assignments) + len(plan.unfilled)} open slot(s) from {start} to {until}: "
+            f"{len(plan.assignments)} assigned, {len(plan.unfilled)} left unfilled "
+            f"({len(plan.loads_after)} eligible user(s), planned in {elapsed:.2f}s)."
+        )
+        self.stdout.write(f"Slots per user before: {self.distribution(plan.loads_before)}")
+        self.stdout.write(f"Slots per user after:  {self.distribution(plan.loads_after)}")
+
+        if options["dry_run"]:
+            self.stdout.write("Dry run, nothing saved.")
+            return
+        assigned = apply_plan(plan)
+        skipped = len(plan.assignments) - assigned
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {assigned} slot(s)" + (f", skipped {skipped} taken meanwhile." if skipped else ".")
+        ))
+
+    def distribution(self, loads):
+        if not loads:
+            return "-"
+        counts = Counter(loads.values())
+        return (
+            f"min {min(counts)}, max {max(counts)}, "
+            + ", ".join(f"{count}x{load}" for load, count in sorted(counts.items()))
+        )
@@ -0,0 +1,294 @@
+import json
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.feeds import user_feed_token
+from core.models import DEFAULT_CAPACITY, HomeTeam, Match, Offer, Profile, VolunteerSlot
+from core.services import recount_volunteers
+from core.trades import TradeGraph
+from core.utils import calendars_by_user
+
+from .loadtest import percentile
+
+# a private cache, so that cold runs can clear it without touching a shared one
+BENCHMARK_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with a realistic season and measure latency, query "
+        "count and memory of the main views. Writes a JSON report; pass an earlier one "
+        "to --compare to spot regressions between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--teams", type=int, default=200)
+        parser.add_argument("--matches", type=int, default=5000)
+        parser.add_argument("--users", type=int, default=20000)
+        parser.add_argument("--offers", type=int, default=10000)
+        parser.add_argument("--iterations", type=int, default=30, help="Measured requests per scenario.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", help="Write the report to this file.")
+        parser.add_argument("--compare", help="An earlier --json report to compare against.")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Relative p50 slowdown reported as a regression (default 0.2 = 20%%).")
+        parser.add_argument("--fail-on-regression", action="store_true")
+        parser.add_argument("--keepdb", action="store_true",
+                            help="Keep the benchmark database and reuse its data next time.")
+        parser.add_argument("--use-current-db", action="store_true",
+                            help="Seed the configured database instead of a test database (it must be disposable).")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Can't read {options['compare']}: {exc}")
+
+        if options["use_current_db"]:
+            report = self.benchmark(options)
+        else:
+            setup_test_environment()
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+            try:
+                report = self.benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+                teardown_test_environment()
+
+        for name, result in report["results"].items():
+            self.stdout.write(
+                f"{name}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                f"{result['queries']} queries, peak {result['peak_kib']} KiB"
+            )
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+        if baseline:
+            regressions = self.compare(baseline, report, options["threshold"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+
+    def benchmark(self, options):
+        rng = random.Random(options["seed"])
+        bench_users = 2 * (options["iterations"] + 2)
+        if not (options["keepdb"] and Match.objects.exists()):
+            started = time.perf_counter()
+            self.seed(rng, options, bench_users)
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s.")
+
+        with override_settings(CACHES=BENCHMARK_CACHES, QUERY_BUDGET_RAISE=False):
+            cache.clear()
+            results = {}
+            for name, request, cold in self.scenarios(options["iterations"]):
+                results[name] = self.measure(request, options["iterations"], cold)
+
+        return {
+            "meta": {
+                "commit": self.commit(),
+                "created": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "django": django.get_version(),
+                "sizes": {key: options[key] for key in ("teams", "matches", "users", "offers")},
+                "iterations": options["iterations"],
+            },
+            "results": results,
+        }
+
+    def seed(self, rng, options, bench_users):
+        """Bulk-insert a season; bulk_create skips the signals, so profiles, slots and counters are done here."""
+        today = timezone.localdate()
+        password = make_password(None)
+        teams = HomeTeam.objects.bulk_create(HomeTeam(name=f"Team {i:03}") for i in range(options["teams"]))
+
+        # one match a week per team, half of the season already played
+        weeks = -(-options["matches"] // len(teams))
+        matches = Match.objects.bulk_create(
+            Match(
+                date=today + timedelta(days=7 * (i // len(teams) - weeks // 2) + i % 7),
+                start_time=rng.choice(["10:00", "13:30", "16:00", "19:30"]),
+                home_team=teams[i % len(teams)],
+                guest_team=f"Visitors {rng.randrange(500)}",
+                location=f"Hall {rng.randrange(20)}",
+            )
+            for i in range(options["matches"])
+        )
+
+        users = User.objects.bulk_create(
+            [User(username=f"volunteer{i}", password=password) for i in range(options["users"])]
+            + [User(username=f"bench{i}", password=password) for i in range(bench_users)]
+        )
+        # 70% of the volunteers play in a team; the bench users sign up and accept offers during the run
+        volunteers = users[:options["users"]]
+        Profile.objects.bulk_create(
+            Profile(user=user, home_team=rng.choice(teams) if n < options["users"] and rng.random() < 0.7 else None)
+            for n, user in enumerate(users)
+        )
+
+        # about 60% of the slots taken, by distinct volunteers within a match
+        slots = []
+        for match in matches:
+            taken = rng.sample(volunteers, DEFAULT_CAPACITY)
+            slots += [
+                VolunteerSlot(match=match, volunteer=taken[n] if rng.random() < 0.6 else None)
+                for n in range(DEFAULT_CAPACITY)
+            ]
+        slots = VolunteerSlot.objects.bulk_create(slots)
+        recount_volunteers(Match.objects.all())
+
+        filled = [slot for slot in slots if slot.volunteer_id]
+        Offer.objects.bulk_create(
+            Offer(
+                user_id=slot.volunteer_id,
+                slot=slot,
+                type=rng.choice(["trade", "time"]),
+                status=rng.choices(["open", "accepted", "cancelled"], [7, 2, 1])[0],
+            )
+            for slot in rng.sample(filled, min(options["offers"], len(filled)))
+        )
+
+    def scenarios(self, iterations):
+        """
+        Yield ``(name, request(i), cold)``; request(i) must work for i in 0..iterations + 1
+        and return a response, or None for scenarios that don't go through a view.
+        """
+        today = timezone.localdate()
+        bench = list(User.objects.filter(username__startswith="bench").order_by("id"))
+        viewer = User.objects.get(pk=VolunteerSlot.objects.filter(volunteer__isnull=False).order_by("id")
+                                  .values_list("volunteer", flat=True).first())
+        team = HomeTeam.objects.order_by("id").first()
+
+        def get(user, url, **params):
+            client = Client()
+            client.force_login(user)
+            return lambda i: client.get(url, params)
+
+        yield "match_list", get(viewer, reverse("match_list")), False
+        yield "match_list_team", get(viewer, reverse("match_list"), team=team.name), False
+        yield "match_list_my_matches", get(viewer, reverse("match_list"), my_matches="on"), False
+        yield "my_schedule", get(viewer, reverse("my_schedule")), False
+        yield "match_list_archive", get(viewer, reverse("match_list"), archive="on"), False
+        yield "offer_list", get(viewer, reverse("offer_list")), False
+        yield "offer_list_closed", get(viewer, reverse("offer_list"), status="closed"), False
+
+        # every signup and acceptance needs its own user and slot, in a match no bench
+        # user joined yet (with --keepdb, earlier runs did)
+        upcoming = Match.objects.filter(date__gte=today).exclude(
+            Exists(VolunteerSlot.objects.filter(match=OuterRef("pk"), volunteer__username__startswith="bench"))
+        )
+        # first open slot of each of those matches
+        open_slots = dict(
+            VolunteerSlot.objects.filter(match__in=upcoming, volunteer__isnull=True)
+            .order_by("match_id", "-id").values_list("match_id", "id")
+        )
+        open_slots = list(open_slots.items())[:iterations + 2]
+        offers = list(
+            Offer.objects.filter(status="open", type="trade", slot__match__in=upcoming)
+            .order_by("id").values_list("id", flat=True)[:iterations + 2]
+        )
+        if len(open_slots) < iterations + 2 or len(offers) < iterations + 2:
+            raise CommandError("Not enough open slots or offers for that many iterations, seed more matches.")
+
+        signup_clients = [Client() for _ in range(iterations + 2)]
+        accept_clients = [Client() for _ in range(iterations + 2)]
+        for n, client in enumerate(signup_clients + accept_clients):
+            client.force_login(bench[n])
+        yield "signup_slot", lambda i: signup_clients[i].get(reverse("signup_slot", args=open_slots[i])), False
+        yield "accept_offer", lambda i: accept_clients[i].get(reverse("accept_offer", args=[offers[i]])), False
+
+        # feeds are cached, cold runs measure building the ICS
+        client = Client()
+        yield "ics_user_feed", lambda i: client.get(reverse("user_calendar", args=[user_feed_token(viewer)])), True
+        yield "ics_team_feed", lambda i: client.get(reverse("team_calendar", args=[team.id])), True
+
+        # the season kickoff mailing: every assigned slot (about 9000 with the default sizes)
+        def batch_calendars(i):
+            for _ in calendars_by_user(VolunteerSlot.objects.all()):
+                pass
+        yield "ics_batch_all_volunteers", batch_calendars, False
+
+        # the trade engine's search alone, on a dense graph: 3000 offers by 3000 users
+        # over 300 matches, every user blocked from 10 of them
+        offers = [(n, n, n % 300) for n in range(3000)]
+        blocked = {n: {(n + k * 31) % 300 for k in range(10)} | {n % 300} for n in range(3000)}
+
+        def trade_graph(i):
+            TradeGraph(offers, blocked).cycles()
+        yield "trade_graph", trade_graph, False
+
+    def measure(self, request, iterations, cold):
+        def call(i):
+            if cold:
+                cache.clear()
+            response = request(i)
+            if response is not None and response.status_code >= 400:
+                raise CommandError(f"Got a {response.status_code} response.")
+            return response
+
+        call(0)  # warm-up: imports, templates, and a filled cache
+        latencies, queries = [], []
+        for i in range(1, iterations + 1):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                call(i)
+                latencies.append(time.perf_counter() - start)
+            queries.append(len(ctx))
+
+        # traced separately, tracemalloc slows everything down
+        tracemalloc.start()
+        call(iterations + 1)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+            "queries": max(queries),
+            "peak_kib": round(peak / 1024, 1),
+        }
+
+    def compare(self, baseline, report, threshold):
+        regressions = []
+        before_commit = baseline.get("meta", {}).get("commit") or "baseline"
+        self.stdout.write(f"Compared with {before_commit}:")
+        for name, result in report["results"].items():
+            before = baseline.get("results", {}).get(name)
+            if before is None:
+                continue
+            ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1
+            worse = ratio > 1 + threshold or result["queries"] > before["queries"]
+            if worse:
+                regressions.append(name)
+            self.stdout.write(
+                f"  {name}: p50 {before['p50_ms']} -> {result['p50_ms']} ms ({ratio:.2f}x), "
+                f"queries {before['queries']} -> {result['queries']}" + ("  REGRESSION" if worse else "")
+            )
+        return regressions
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.roster import CHUNK_SIZE, roster_csv, roster_slots
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the volunteer roster (match, teams, location, volunteer name, email and "
+        "phone number) as CSV, one row per slot. Streams, so a whole season is fine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="First match date (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Last match date (YYYY-MM-DD).")
+        parser.add_argument("--team", help="Only matches of this home team.")
+        parser.add_argument("--output", "-o", help="File to write, default stdout.")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows fetched per round trip.")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options["start"]) if options["start"] else None
+            until = date.fromisoformat(options["until"]) if options["until"] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        lines = roster_csv(roster_slots(start, until, options["team"]), options["chunk_size"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", newline="", encoding="utf-8") as f:
+            rows = -1  # the header
+            for line in lines:
+                f.write(line)
+                rows += 1
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} slot(s) to {options['output']}."))
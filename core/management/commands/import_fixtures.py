@@ -0,0 +1,118 @@
+import csv
+import json
+from datetime import date, time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.cache import invalidate
+from core.models import HomeTeam, Match, VolunteerSlot
+
+FIELDS = ("date", "start_time", "home_team", "guest_team", "location")
+
+
+def read_rows(path, fmt):
+    """Yield one dict per fixture without loading the whole file (except plain JSON arrays)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a season schedule from CSV, JSON or JSON Lines. Columns: "
+        "date (YYYY-MM-DD), start_time (HH:MM), home_team, guest_team, location. "
+        "Existing matches (same home team, date and start time) are updated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "json", "jsonl"],
+                            help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--create-teams", action="store_true",
+                            help="Create home teams that don't exist yet instead of failing.")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        fmt = options["format"] or path.suffix.lstrip(".").lower()
+        if fmt not in ("csv", "json", "jsonl"):
+            raise CommandError(f"Unknown format {fmt!r}, use --format.")
+        if not path.exists():
+            raise CommandError(f"{path} does not exist.")
+
+        # every team name resolved from one query
+        self.teams = dict(HomeTeam.objects.values_list("name", "id"))
+        self.create_teams = options["create_teams"]
+        self.imported = []
+        matches = slots = 0
+
+        with transaction.atomic():
+            batch = {}
+            for line, row in enumerate(read_rows(path, fmt), start=1):
+                match = self.build_match(line, row)
+                # the last row wins if the file lists the same match twice
+                batch[(match.home_team_id, match.date, match.start_time)] = match
+                if len(batch) >= options["batch_size"]:
+                    slots += self.save_batch(list(batch.values()))
+                    matches += len(batch)
+                    batch = {}
+            if batch:
+                slots += self.save_batch(list(batch.values()))
+                matches += len(batch)
+            # bulk_create skips post_save, so cached schedule data is invalidated here
+            invalidate("calendar", "schedule", *(f"match:{pk}" for pk in self.imported))
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {matches} match(es), created {slots} slot(s)."))
+
+    def build_match(self, line, row):
+        missing = [field for field in FIELDS[:4] if not row.get(field)]
+        if missing:
+            raise CommandError(f"Row {line}: missing {', '.join(missing)}.")
+        try:
+            match_date = date.fromisoformat(row["date"].strip())
+            start_time = time.fromisoformat(row["start_time"].strip())
+        except ValueError as exc:
+            raise CommandError(f"Row {line}: {exc}.")
+
+        name = row["home_team"].strip()
+        if name not in self.teams:
+            if not self.create_teams:
+                raise CommandError(f"Row {line}: unknown home team {name!r} (use --create-teams).")
+            self.teams[name] = HomeTeam.objects.create(name=name).id
+
+        return Match(
+            date=match_date,
+            start_time=start_time,
+            home_team_id=self.teams[name],
+            guest_team=row["guest_team"].strip(),
+            location=(row.get("location") or "").strip(),
+        )
+
+    def save_batch(self, batch):
+        """Upsert the matches, then give the new ones their slots in one insert."""
+        Match.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["home_team", "date", "start_time"],
+            update_fields=["guest_team", "location"],
+        )
+        ids = [match.pk for match in batch]
+        self.imported.extend(ids)
+        has_slots = set(
+            VolunteerSlot.objects.filter(match_id__in=ids).values_list("match_id", flat=True).distinct()
+        )
+        new_slots = [
+            VolunteerSlot(match_id=match.pk)
+            for match in batch if match.pk not in has_slots
+            for _ in range(match.capacity)
+        ]
+        VolunteerSlot.objects.bulk_create(new_slots)
+        return len(new_slots)
@@ -0,0 +1,108 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+DEFAULT_PATHS = ["/", "/trading/", "/api/matches/"]
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # a redirect is the answer we time, following it would time two views
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test a running server: concurrent GETs per path, reporting requests/second "
+        "and latency percentiles. Run it once against each deployment (e.g. WSGI, then "
+        "ASGI) with --json, and pass the first report to --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--path", action="append", dest="paths",
+                            help=f"Path to request, repeatable. Default: {' '.join(DEFAULT_PATHS)}")
+        parser.add_argument("--requests", type=int, default=500, help="Requests per path.")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--username", default="loadtest",
+                            help="Requests are made as this user, created if missing.")
+        parser.add_argument("--json", help="Write the report to this file.")
+        parser.add_argument("--compare", help="A previous --json report to compare against.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Can't read {options['compare']}: {exc}")
+
+        # a session in the database the server uses, so no login form is involved
+        user, _ = User.objects.get_or_create(username=options["username"])
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        opener = urllib.request.build_opener(NoRedirect)
+        report = {}
+        for path in options["paths"] or DEFAULT_PATHS:
+            url = options["base_url"].rstrip("/") + path
+            report[path] = self.run(opener, url, cookie, options["requests"], options["concurrency"])
+            self.print_result(path, report[path], baseline.get(path) if baseline else None)
+
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def run(self, opener, url, cookie, count, concurrency):
+        def fetch(_):
+            request = urllib.request.Request(url, headers={"Cookie": cookie})
+            start = time.perf_counter()
+            try:
+                with opener.open(request, timeout=30) as response:
+                    response.read()
+                    ok = True
+            except urllib.error.HTTPError as exc:
+                ok = exc.code < 400
+            except OSError:
+                ok = False
+            return time.perf_counter() - start, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(count)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, ok in results)
+        return {
+            "requests": count,
+            "errors": sum(1 for latency, ok in results if not ok),
+            "rps": round(count / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1),
+        }
+
+    def print_result(self, path, result, before):
+        line = (
+            f"{path}: {result['rps']} req/s, p50 {result['p50_ms']} ms, "
+            f"p99 {result['p99_ms']} ms, {result['errors']} error(s)"
+        )
+        if before:
+            line += (
+                f"  (was {before['rps']} req/s, p99 {before['p99_ms']} ms: "
+                f"{result['rps'] / before['rps']:.2f}x throughput)"
+            )
+        self.stdout.write(line)
@@ -0,0 +1,62 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from core.mail import new_queued_email
+from core.models import QueuedEmail, VolunteerSlot
+from core.utils import calendars_by_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue one email per assigned volunteer with their whole schedule attached as a "
+        "single calendar file, e.g. at season kickoff. Delivered by send_queued_mail."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="First match date (YYYY-MM-DD), default today.")
+        parser.add_argument("--until", help="Last match date (YYYY-MM-DD).")
+        parser.add_argument("--team", help="Only matches of this home team.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Count the emails without queueing them.")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options["start"]) if options["start"] else timezone.localdate()
+            until = date.fromisoformat(options["until"]) if options["until"] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        slots = VolunteerSlot.objects.filter(match__date__gte=start).exclude(volunteer__email="")
+        if until:
+            slots = slots.filter(match__date__lte=until)
+        if options["team"]:
+            slots = slots.filter(match__home_team__name=options["team"])
+
+        queued = 0
+        with transaction.atomic():
+            batch = []
+            for user, user_slots, ics in calendars_by_user(slots):
+                batch.append(new_queued_email(
+                    "Your volunteering schedule",
+                    render_to_string("volunteers/email_schedule.txt", {
+                        "user": user, "slots": user_slots, "team": options["team"],
+                    }),
+                    to=[user.email],
+                    attachments=[("volunteering.ics", ics, "text/calendar")],
+                ))
+                if len(batch) >= options["batch_size"]:
+                    queued += self.save(batch, options["dry_run"])
+                    batch = []
+            queued += self.save(batch, options["dry_run"])
+
+        verb = "Would queue" if options["dry_run"] else "Queued"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {queued} schedule email(s)."))
+
+    def save(self, batch, dry_run):
+        if not dry_run:
+            QueuedEmail.objects.bulk_create(batch)
+        return len(batch)
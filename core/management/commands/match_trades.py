@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Offer
+from core.trades import execute_trade, find_trades
+
+
+class Command(BaseCommand):
+    help = (
+        "Swap slots between open trade offers: pairs, and cycles of up to four people "
+        "who can each take the next one's slot. New trade offers are matched as they "
+        "come in; this catches what was left, e.g. after slots changed hands."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="List the swaps without making them.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        trades = find_trades()
+        elapsed = time.perf_counter() - started
+
+        offers = Offer.objects.select_related("user", "slot__match__home_team").in_bulk(
+            [offer_id for offer_ids in trades for offer_id in offer_ids]
+        )
+        done = 0
+        for offer_ids in trades:
+            parties = " -> ".join(f"{offers[pk].user} ({offers[pk].slot.match})" for pk in offer_ids)
+            if options["dry_run"]:
+                self.stdout.write(f"Would swap: {parties}")
+            elif execute_trade(offer_ids):
+                done += 1
+                self.stdout.write(f"Swapped: {parties}")
+            else:
+                self.stdout.write(f"Skipped, changed meanwhile: {parties}")
+
+        verb = "Found" if options["dry_run"] else f"Made {done} of"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(trades)} swap(s), searched in {elapsed:.2f}s."))
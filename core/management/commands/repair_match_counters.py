@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.cache import invalidate
+from core.models import Match
+from core.services import drifted_counters, recount_volunteers
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the filled/open slot counters of every match whose counters don't "
+        "agree with its slots, e.g. after editing slots in the database by hand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Matches recounted per UPDATE.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the matches that are off.")
+
+    def handle(self, *args, **options):
+        # one query finds them, then an UPDATE per batch keeps the locks short
+        match_ids = list(drifted_counters(Match.objects.all()).order_by("pk").values_list("pk", flat=True))
+        if options["dry_run"]:
+            self.stdout.write(f"{len(match_ids)} match(es) with wrong counters.")
+            return
+
+        size = options["batch_size"]
+        for start in range(0, len(match_ids), size):
+            batch = match_ids[start:start + size]
+            with transaction.atomic():
+                recount_volunteers(Match.objects.filter(pk__in=batch))
+                invalidate("calendar", *(f"match:{pk}" for pk in batch))
+        self.stdout.write(self.style.SUCCESS(f"Repaired the counters of {len(match_ids)} match(es)."))
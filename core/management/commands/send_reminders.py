@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from core.mail import new_queued_email, send_queued_emails
+from core.models import QueuedEmail, VolunteerSlot
+from core.utils import volunteering_window
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue a reminder for every volunteer whose match starts within the next --hours. "
+        "Each slot is reminded once per volunteer and kickoff, so the command can run "
+        "from cron as often as needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=48)
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Emails inserted per query, and sent per SMTP connection with --send.")
+        parser.add_argument("--send", action="store_true",
+                            help="Drain the outbox right away instead of leaving it to the send_queued_mail worker.")
+        parser.add_argument("--dry-run", action="store_true", help="Count the reminders without queueing them.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        until = now + timedelta(hours=options["hours"])
+        # one query for every slot, match, team and volunteer in the window
+        slots = (
+            VolunteerSlot.objects.filter(
+                volunteer__isnull=False,
+                match__date__range=(timezone.localdate(now), timezone.localdate(until)),
+            )
+            .exclude(volunteer__email="")
+            .select_related("match__home_team", "volunteer")
+            .order_by("match__date", "match__start_time", "id")
+        )
+
+        queued = 0
+        batch = []
+        for slot in slots.iterator(chunk_size=options["batch_size"]):
+            match = slot.match
+            kickoff = timezone.make_aware(
+                datetime.combine(match.date, match.start_time), timezone.get_current_timezone()
+            )
+            if not now <= kickoff <= until:
+                continue
+            batch.append((slot, kickoff))
+            if len(batch) >= options["batch_size"]:
+                queued += self.queue(batch, options["dry_run"])
+                batch = []
+        queued += self.queue(batch, options["dry_run"])
+
+        verb = "Would queue" if options["dry_run"] else "Queued"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {queued} reminder(s)."))
+
+        if options["send"] and not options["dry_run"]:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = send_queued_emails(options["batch_size"])
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < options["batch_size"]:
+                    break
+            self.stdout.write(f"Sent {total_sent} email(s), {total_failed} failed.")
+
+    def queue(self, batch, dry_run):
+        """Queue the reminders of one batch that weren't queued before; returns how many."""
+        # a new volunteer or a new kickoff time makes a new key, so they are reminded too
+        keys = {f"reminder:{slot.pk}:{slot.volunteer_id}:{kickoff:%Y%m%d%H%M}": (slot, kickoff) for slot, kickoff in batch}
+        done = set(QueuedEmail.objects.filter(key__in=keys).values_list("key", flat=True))
+        emails = []
+        for key, (slot, kickoff) in keys.items():
+            if key in done:
+                continue
+            emails.append(new_queued_email(
+                f"⏰ Reminder: Volunteering for {slot.match}",
+                render_to_string("volunteers/email_reminder.txt", {
+                    "user": slot.volunteer,
+                    "slot": slot,
+                    "arrival_time": volunteering_window(slot.match)[0],
+                }),
+                to=[slot.volunteer.email],
+                key=key,
+            ))
+        if emails and not dry_run:
+            # ignore_conflicts: a run in parallel may have queued some of them meanwhile
+            QueuedEmail.objects.bulk_create(emails, ignore_conflicts=True)
+        return len(emails)
@@ -0,0 +1,78 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .instrumentation import RequestTimings, current_timings, stats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudgetMiddleware:
+    """
+    Measure every request and keep a rolling summary per URL name.
+
+    Staff users (and everyone when DEBUG is on) get the numbers back in a
+    Server-Timing header. A view that runs more queries than its entry in
+    settings.QUERY_BUDGETS is logged, or raises QueryBudgetExceeded when
+    settings.QUERY_BUDGET_RAISE is on, which makes it fail tests.
+    """
+
+    # both, so it doesn't push the requests of an async (ASGI) chain onto a thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        total = timings.elapsed
+        is_staff = getattr(getattr(request, "user", None), "is_staff", False)
+        return self.finish(request, response, timings, total, is_staff)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        # sync_to_async copies the context, so queries run in ORM threads are counted too
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        total = timings.elapsed
+        # request.user is lazy and loads with the sync ORM, which the event loop can't use
+        user = await request.auser() if hasattr(request, "auser") and not settings.DEBUG else None
+        return self.finish(request, response, timings, total, getattr(user, "is_staff", False))
+
+    def finish(self, request, response, timings, total, is_staff):
+        match = request.resolver_match
+        name = match.view_name if match else "<unresolved>"
+        stats.add(name, timings, total)
+
+        if settings.DEBUG or is_staff:
+            response["Server-Timing"] = (
+                f'db;dur={timings.db_time * 1000:.1f};desc="{timings.queries} queries", '
+                f"tpl;dur={timings.template_time * 1000:.1f}, "
+                f"total;dur={total * 1000:.1f}"
+            )
+
+        budget = getattr(settings, "QUERY_BUDGETS", {}).get(name)
+        if budget is not None and timings.queries > budget:
+            message = f"{name} ran {timings.queries} queries, its budget is {budget}."
+            if getattr(settings, "QUERY_BUDGET_RAISE", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def release_duplicate_slots(apps, schema_editor):
+    """Keep each user's first slot per match and open the others, so the constraint can be added."""
+    VolunteerSlot = apps.get_model("core", "VolunteerSlot")
+    seen = set()
+    duplicates = []
+    for slot_id, match_id, volunteer_id in (
+        VolunteerSlot.objects.filter(volunteer__isnull=False)
+        .order_by("match_id", "volunteer_id", "id")
+        .values_list("id", "match_id", "volunteer_id")
+    ):
+        if (match_id, volunteer_id) in seen:
+            duplicates.append(slot_id)
+        seen.add((match_id, volunteer_id))
+    VolunteerSlot.objects.filter(id__in=duplicates).update(volunteer=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_profile_phone_number_alter_offer_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['date', 'start_time', 'id'], name='match_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='offer_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='volunteerslot',
+            index=models.Index(fields=['match', 'volunteer'], name='slot_match_volunteer_idx'),
+        ),
+        migrations.RunPython(release_duplicate_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='volunteerslot',
+            constraint=models.UniqueConstraint(condition=models.Q(('volunteer__isnull', False)), fields=('match', 'volunteer'), name='unique_volunteer_per_match'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:42
+
+from django.db import migrations
+
+
+def closed_to_accepted(apps, schema_editor):
+    # accepted offers used to be stored as "closed", which is not a valid choice
+    Offer = apps.get_model("core", "Offer")
+    Offer.objects.filter(status="closed").update(status="accepted")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_queuedemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(closed_to_accepted, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+def merge_duplicate_matches(apps, schema_editor):
+    """
+    Merge matches that share home team, date and start time, so the constraint
+    can be added. The oldest one is kept and takes over the volunteers of the
+    others, with their slots and offers, in place of its open slots; a
+    volunteer already in it keeps their slot there. Matches that differ in
+    guest team or location can't be told apart automatically: the migration
+    stops and lists them instead.
+    """
+    Match = apps.get_model("core", "Match")
+    VolunteerSlot = apps.get_model("core", "VolunteerSlot")
+    groups = {}
+    for match_id, home_team_id, day, kickoff, guest, location in Match.objects.order_by("id").values_list(
+        "id", "home_team_id", "date", "start_time", "guest_team", "location"
+    ):
+        groups.setdefault((home_team_id, day, kickoff), []).append((match_id, guest, location))
+    duplicates = {key: matches for key, matches in groups.items() if len(matches) > 1}
+
+    conflicts = [
+        matches for matches in duplicates.values() if len({(guest, location) for _, guest, location in matches}) > 1
+    ]
+    if conflicts:
+        raise RuntimeError(
+            "Matches share a home team and kickoff but not the guest team or location, "
+            "remove or move all but one of each before migrating (match ids): "
+            + "; ".join(", ".join(str(match_id) for match_id, _, _ in matches) for matches in conflicts)
+        )
+
+    for matches in duplicates.values():
+        kept, others = matches[0][0], [match_id for match_id, _, _ in matches[1:]]
+        kept_slots = VolunteerSlot.objects.filter(match_id=kept)
+        size = kept_slots.count()
+        members = set(kept_slots.filter(volunteer__isnull=False).values_list("volunteer_id", flat=True))
+        moved = []
+        for slot_id, volunteer_id in VolunteerSlot.objects.filter(
+            match_id__in=others, volunteer__isnull=False
+        ).order_by("id").values_list("id", "volunteer_id"):
+            if volunteer_id not in members:
+                members.add(volunteer_id)
+                moved.append(slot_id)
+        VolunteerSlot.objects.filter(id__in=moved).update(match_id=kept)
+        # as far as there are open slots to give up
+        surplus = kept_slots.count() - max(size, len(members))
+        if surplus > 0:
+            open_ids = kept_slots.filter(volunteer__isnull=True).order_by("-id").values_list("id", flat=True)
+            VolunteerSlot.objects.filter(id__in=list(open_ids[:surplus])).delete()
+        # their remaining slots and offers go with them
+        Match.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+    # The merge deletes rows, which on PostgreSQL leaves deferred foreign key
+    # checks pending; ALTER TABLE refuses to run until they are committed.
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_offer_status_transitions'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_matches, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.UniqueConstraint(fields=('home_team', 'date', 'start_time'), name='unique_home_team_kickoff'),
+        ),
+    ]
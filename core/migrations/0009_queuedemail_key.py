@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_unique_home_team_kickoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedemail',
+            name='key',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
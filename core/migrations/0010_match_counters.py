@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:56
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def count_volunteers(apps, schema_editor):
+    Match = apps.get_model("core", "Match")
+    VolunteerSlot = apps.get_model("core", "VolunteerSlot")
+    filled = Coalesce(Subquery(
+        VolunteerSlot.objects.filter(match=OuterRef("pk"), volunteer__isnull=False)
+        .values("match").annotate(filled=Count("id")).values("filled")
+    ), Value(0))
+    Match.objects.update(
+        open_slots=Greatest(F("capacity") - filled, Value(0), output_field=IntegerField()),
+        filled_slots=filled,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_queuedemail_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='capacity',
+            field=models.PositiveSmallIntegerField(default=3, help_text='Volunteers needed.'),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='filled_slots',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='open_slots',
+            field=models.PositiveSmallIntegerField(default=3, editable=False),
+        ),
+        migrations.RunPython(count_volunteers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(condition=models.Q(('open_slots__gt', 0)), fields=['date', 'start_time', 'id'], name='match_open_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['-open_slots', 'date', 'start_time', 'id'], name='match_urgency_idx'),
+        ),
+    ]
@@ -1,8 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
 
 
 class HomeTeam(models.Model):
@@ -20,6 +19,20 @@ class Profile(models.Model):
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def for_user(cls, user):
+        """The user's profile, cached on the user; created here for accounts that predate profiles."""
+        try:
+            return user.profile
+        except cls.DoesNotExist:
+            profile, _ = cls.objects.get_or_create(user=user)
+            user.profile = profile
+            return profile
+
+
+DEFAULT_CAPACITY = 3
+
+
 class Match(models.Model):
     date = models.DateField()
     start_time = models.TimeField()
@@ -31,20 +44,48 @@ class Match(models.Model):
     )
     guest_team = models.CharField(max_length=100)
     location = models.CharField(max_length=100, blank=True)
+    capacity = models.PositiveSmallIntegerField(default=DEFAULT_CAPACITY, help_text="Volunteers needed.")
+    # Kept in step with the slots by core.services and core.signals, so nothing
+    # has to count slots per request; repair_match_counters recomputes them.
+    # open_slots is capacity - filled_slots, but never below zero.
+    filled_slots = models.PositiveSmallIntegerField(default=0, editable=False)
+    open_slots = models.PositiveSmallIntegerField(default=DEFAULT_CAPACITY, editable=False)
+
+    class Meta:
+        indexes = [
+            # match_list filters, sorts and pages on (date, start_time, id)
+            models.Index(fields=["date", "start_time", "id"], name="match_schedule_idx"),
+            # the same for "only matches that still need volunteers"
+            models.Index(
+                fields=["date", "start_time", "id"], condition=models.Q(open_slots__gt=0), name="match_open_schedule_idx",
+            ),
+            # "most open slots first"
+            models.Index(fields=["-open_slots", "date", "start_time", "id"], name="match_urgency_idx"),
+        ]
+        constraints = [
+            # a team plays one match at a time; also the key fixture imports upsert on
+            models.UniqueConstraint(fields=["home_team", "date", "start_time"], name="unique_home_team_kickoff"),
+        ]
 
     def __str__(self):
         return f"{self.date} {self.start_time.strftime('%H:%M')} – {self.home_team} vs {self.guest_team}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.open_slots = max(self.capacity - self.filled_slots, 0)
+        super().save(*args, **kwargs)
+
     @property
     def volunteer_count(self):
-        return self.slots.filter(volunteer__isnull=False).count()
+        return self.filled_slots
 
     def required_slots(self):
-        return self.slots.count()
-    
-    def create_slots(self, num=3):
-        for _ in range(num - self.slots.count()):
-            VolunteerSlot.objects.create(match=self)
+        return self.capacity
+
+    def create_slots(self, num=None):
+        """Add open slots up to ``num``, the capacity by default."""
+        missing = (self.capacity if num is None else num) - self.slots.count()
+        VolunteerSlot.objects.bulk_create(VolunteerSlot(match=self) for _ in range(missing))
 
 class VolunteerSlot(models.Model):
     match = models.ForeignKey(Match, on_delete=models.CASCADE, related_name="slots")
@@ -56,11 +97,32 @@ class VolunteerSlot(models.Model):
         related_name="volunteer_slots"
     )
 
+    class Meta:
+        indexes = [
+            # "is this user in the match?" and "first open slot of the match"
+            models.Index(fields=["match", "volunteer"], name="slot_match_volunteer_idx"),
+        ]
+        constraints = [
+            # a user holds at most one slot per match; open slots are unrestricted
+            models.UniqueConstraint(
+                fields=["match", "volunteer"],
+                condition=models.Q(volunteer__isnull=False),
+                name="unique_volunteer_per_match",
+            ),
+        ]
+
     def __str__(self):
         if self.volunteer:
             return f"{self.match} – {self.volunteer.username}"
         return f"{self.match} – (open slot)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        slot = super().from_db(db, field_names, values)
+        # the volunteer as loaded, so a save can tell whose schedule it changed
+        slot._loaded_volunteer_id = slot.__dict__.get("volunteer_id")
+        return slot
+
 class Offer(models.Model):
     OFFER_TYPE_CHOICES = [
         ("time", "I'm available!"),
@@ -72,6 +134,13 @@ class Offer(models.Model):
         ("completed", "Completed"),
         ("cancelled", "Cancelled"),
     ]
+    # allowed status changes, anything else is a bug in the caller
+    TRANSITIONS = {
+        "open": {"accepted", "cancelled"},
+        "accepted": {"completed"},
+        "completed": set(),
+        "cancelled": set(),
+    }
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     slot = models.ForeignKey("VolunteerSlot", on_delete=models.CASCADE)
     type = models.CharField(max_length=10, choices=OFFER_TYPE_CHOICES)
@@ -79,23 +148,49 @@ class Offer(models.Model):
     details = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # the trading board filters on status and shows the newest first;
+            # id breaks ties between offers created in the same instant
+            models.Index(fields=["status", "-created_at", "-id"], name="offer_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.get_type_display()} ({self.slot})"
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        from .models import Profile  # avoid circular import
-        Profile.objects.create(user=instance)
+    def transition_to(self, status):
+        if status not in self.TRANSITIONS[self.status]:
+            raise ValueError(f"An offer cannot go from {self.status!r} to {status!r}.")
+        self.status = status
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+class QueuedEmail(models.Model):
+    """An outgoing email waiting in the outbox; delivered by the send_queued_mail command."""
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True)
+    # list of [filename, content, mimetype]
+    attachments = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # set for emails that must go out only once, e.g. "reminder:<slot>:<volunteer>:<kickoff>"
+    key = models.CharField(max_length=100, unique=True, null=True, blank=True)
 
-# Signal to create 3 empty slots whenever a match is created
-@receiver(post_save, sender=Match)
-def create_slots_for_match(sender, instance, created, **kwargs):
-    if created:
-        for _ in range(3):
-            VolunteerSlot.objects.create(match=instance)
+    class Meta:
+        indexes = [
+            # the worker polls for pending mail that is due
+            models.Index(fields=["status", "next_attempt_at"], name="email_due_idx"),
+        ]
 
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
@@ -0,0 +1,81 @@
+import base64
+import binascii
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    raw = "|".join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(queryset, fields, cursor):
+    """Turn a cursor back into typed field values, or None if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if len(parts) != len(fields):
+        return None
+
+    opts = queryset.model._meta
+    try:
+        return [opts.get_field(field.lstrip("-")).to_python(part) for field, part in zip(fields, parts)]
+    except ValidationError:
+        return None
+
+
+def keyset_filter(fields, values):
+    """
+    Build the "comes after this row" condition for a keyset ordering.
+
+    (a, b, c) > (x, y, z) becomes a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z),
+    with "<" for fields ordered descending.
+    """
+    condition = Q()
+    for i, field in enumerate(fields):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        equal = {f.lstrip("-"): v for f, v in zip(fields[:i], values[:i])}
+        condition |= Q(**equal, **{f"{name}__{lookup}": values[i]})
+    return condition
+
+
+def _page_queryset(queryset, fields, cursor):
+    queryset = queryset.order_by(*fields)
+    if cursor:
+        values = decode_cursor(queryset, fields, cursor)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(fields, values))
+    return queryset
+
+
+def _split_page(objects, fields, page_size):
+    # one extra row tells us whether there is a next page
+    next_cursor = None
+    if len(objects) > page_size:
+        objects = objects[:page_size]
+        last = objects[-1]
+        next_cursor = encode_cursor(getattr(last, field.lstrip("-")) for field in fields)
+    return objects, next_cursor
+
+
+def keyset_page(queryset, fields, cursor=None, page_size=20):
+    """
+    Return ``(objects, next_cursor)`` for the page that follows ``cursor``.
+
+    ``fields`` is the ordering, e.g. ("date", "start_time", "id"); a leading "-"
+    sorts that field descending. The last field must be unique (normally "id")
+    so that every row has exactly one position. An invalid cursor starts over
+    at the first page.
+    """
+    queryset = _page_queryset(queryset, fields, cursor)
+    return _split_page(list(queryset[:page_size + 1]), fields, page_size)
+
+
+async def akeyset_page(queryset, fields, cursor=None, page_size=20):
+    """keyset_page() for async views."""
+    queryset = _page_queryset(queryset, fields, cursor)
+    return _split_page([obj async for obj in queryset[:page_size + 1]], fields, page_size)
@@ -0,0 +1,89 @@
+"""
+Volunteer roster export as CSV, streamed row by row.
+
+One joined query returns plain tuples (no model instances), read in chunks
+with iterator(), so a season with tens of thousands of slots
+takes constant memory and the download starts with the first chunk.
+"""
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import VolunteerSlot
+
+CHUNK_SIZE = 2000
+
+COLUMNS = (
+    ("date", "match__date"),
+    ("start_time", "match__start_time"),
+    ("home_team", "match__home_team__name"),
+    ("guest_team", "match__guest_team"),
+    ("location", "match__location"),
+    ("username", "volunteer__username"),
+    ("first_name", "volunteer__first_name"),
+    ("last_name", "volunteer__last_name"),
+    ("email", "volunteer__email"),
+    ("phone_number", "volunteer__profile__phone_number"),
+)
+
+
+def roster_slots(start=None, until=None, team=None):
+    """Every slot of the range, open ones included so gaps show up, as tuples in COLUMNS order."""
+    slots = VolunteerSlot.objects.all()
+    if start:
+        slots = slots.filter(match__date__gte=start)
+    if until:
+        slots = slots.filter(match__date__lte=until)
+    if team:
+        slots = slots.filter(match__home_team__name=team)
+    return slots.order_by("match__date", "match__start_time", "match_id", "id").values_list(
+        *(field for column, field in COLUMNS)
+    )
+
+
+class _Echo:
+    """A file-like object csv.writer writes to; write() hands the line back."""
+
+    def write(self, value):
+        return value
+
+
+# a spreadsheet runs cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _cell(value):
+    # open slots have no volunteer, and no profile to join
+    if value is None:
+        return ""
+    # names and usernames are user input: quote them so they stay text
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _line(writer, row):
+    return writer.writerow([_cell(value) for value in row])
+
+
+def roster_csv(slots, chunk_size=CHUNK_SIZE):
+    """The CSV lines of ``roster_slots()``, header first."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(column for column, field in COLUMNS)
+    for row in slots.iterator(chunk_size=chunk_size):
+        yield _line(writer, row)
+
+
+async def aroster_csv(slots, chunk_size=CHUNK_SIZE):
+    """roster_csv() for ASGI, which would otherwise read a sync iterator to the end before sending."""
+    # chunks of roster_csv() in the ORM's thread; aiterator() runs a values_list()
+    # query in the event loop (SynchronousOnlyOperation)
+    lines = roster_csv(slots, chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(lines, chunk_size)))
+    while True:
+        chunk = await next_chunk()
+        for line in chunk:
+            yield line
+        if len(chunk) < chunk_size:
+            break
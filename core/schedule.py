@@ -0,0 +1,55 @@
+"""
+A volunteer's own schedule: their upcoming slots with the open offers on them.
+
+Volunteers check their schedule far more often than the whole board, so it is
+read starting from their slots, in one joined query, and cached per user.
+The cached copy depends on the "volunteer:<user id>" stamp, which is bumped
+whenever one of the user's slots or offers changes, and on "schedule" and
+"teams" for edits to the matches themselves (see core.cache).
+"""
+from django.db.models import F, FilteredRelation, Q
+
+from .cache import cached, get_versions
+from .models import VolunteerSlot
+
+
+def schedule_versions(user_id):
+    return get_versions(["schedule", "teams", f"volunteer:{user_id}"])
+
+
+def schedule_rows(user_id, today):
+    """
+    The user's slots from ``today`` on, soonest first, as dicts; each has the
+    open offers on the slot under "offers" (oldest first).
+    """
+    rows = (
+        VolunteerSlot.objects.filter(volunteer_id=user_id, match__date__gte=today)
+        # a LEFT JOIN on the open offers only, so slots without one are kept
+        .annotate(open_offer=FilteredRelation("offer", condition=Q(offer__status="open")))
+        .order_by("match__date", "match__start_time", "id", "open_offer__created_at", "open_offer__id")
+        .values("id", "match_id")
+        .annotate(
+            date=F("match__date"),
+            start_time=F("match__start_time"),
+            home_team_name=F("match__home_team__name"),
+            guest_team=F("match__guest_team"),
+            location=F("match__location"),
+            offer_id=F("open_offer__id"),
+            offer_type=F("open_offer__type"),
+            offer_created_at=F("open_offer__created_at"),
+        )
+    )
+    slots = {}
+    for row in rows:
+        offer = {"id": row.pop("offer_id"), "type": row.pop("offer_type"), "created_at": row.pop("offer_created_at")}
+        slot = slots.setdefault(row["id"], dict(row, offers=[]))
+        if offer["id"] is not None:
+            slot["offers"].append(offer)
+    return list(slots.values())
+
+
+def user_schedule(user_id, today):
+    """schedule_rows(), cached until the user's slots or offers change."""
+    return cached(
+        "schedule:user", f"{user_id}:{today}", schedule_versions(user_id), lambda: schedule_rows(user_id, today)
+    )
@@ -0,0 +1,244 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import invalidate
+from .events import slot_event
+from .models import Match, Offer, Profile, VolunteerSlot
+
+
+class SlotUnavailable(Exception):
+    """A slot could not be claimed; the message is meant to be shown to the user."""
+
+
+def _counters(filled):
+    # open_slots first: it is computed from the old filled_slots
+    return {
+        "open_slots": Greatest(F("capacity") - filled, Value(0), output_field=IntegerField()),
+        "filled_slots": filled,
+    }
+
+
+def count_volunteers(changes):
+    """
+    Apply ``{match id: volunteers added (or removed, if negative)}`` to the
+    matches' counters in one UPDATE. For writes that bypass VolunteerSlot.save(),
+    whose signal recounts instead.
+    """
+    changes = {match_id: change for match_id, change in changes.items() if change}
+    if changes:
+        change = Case(*(When(pk=match_id, then=Value(n)) for match_id, n in changes.items()), default=Value(0))
+        # never below zero, should the counters have drifted (see repair_match_counters)
+        filled = Greatest(F("filled_slots") + change, Value(0), output_field=IntegerField())
+        Match.objects.filter(pk__in=changes).update(**_counters(filled))
+
+
+def reserve_capacity(match_id):
+    """
+    Count one more volunteer for the match, unless it is full; returns whether
+    it wasn't. The UPDATE locks the match row until the transaction ends, so
+    callers that then take a slot can't overfill the match; undo the count by
+    rolling back when the slot can't be taken.
+    """
+    return bool(
+        Match.objects.filter(pk=match_id, filled_slots__lt=F("capacity")).update(**_counters(F("filled_slots") + 1))
+    )
+
+
+def volunteers_in_match():
+    """A Match expression counting the taken slots, what filled_slots should be."""
+    filled = (
+        VolunteerSlot.objects.filter(match=OuterRef("pk"), volunteer__isnull=False)
+        .values("match")
+        .annotate(filled=Count("id"))
+        .values("filled")
+    )
+    return Coalesce(Subquery(filled), Value(0))
+
+
+def recount_volunteers(matches):
+    """Recompute the counters of a Match queryset from its slots, in one UPDATE; returns the row count."""
+    return matches.update(**_counters(volunteers_in_match()))
+
+
+def drifted_counters(matches):
+    """The matches of a queryset whose counters don't agree with their slots."""
+    return matches.annotate(counted=volunteers_in_match()).exclude(
+        filled_slots=F("counted"), open_slots=Greatest(F("capacity") - F("counted"), Value(0)),
+    )
+
+
+def claim_slot(user, match_id, slot_id=None):
+    """
+    Assign ``user`` to an open slot of the match and return the slot id.
+
+    The match's counters are bumped first, by an UPDATE that only matches
+    while the match is not full. That locks the match row (SQLite: takes the
+    write lock) before anything is read, so claims on the same match are
+    serialized and the capacity check can trust the counters. The claim
+    itself is a single conditional UPDATE that only matches while the slot
+    is still open and the user has no slot in the match yet, so two
+    volunteers racing for the last slot cannot both win. Without ``slot_id``
+    any open slot is taken, skipping slots another transaction is holding.
+
+    Raises SlotUnavailable when the claim fails, which rolls the counters back.
+    """
+    with transaction.atomic():
+        if not reserve_capacity(match_id):
+            if not Match.objects.filter(pk=match_id).exists():
+                raise SlotUnavailable("This match no longer exists.")
+            raise SlotUnavailable(_claim_failure_reason(user, match_id))
+
+        if slot_id is None:
+            slot_id = (
+                VolunteerSlot.objects.select_for_update(skip_locked=True)
+                .filter(match_id=match_id, volunteer__isnull=True)
+                .order_by("id")
+                .values_list("id", flat=True)
+                .first()
+            )
+            if slot_id is None:
+                raise SlotUnavailable("This match has no open slot left.")
+
+        match_slots = VolunteerSlot.objects.filter(match_id=match_id)
+        try:
+            with transaction.atomic():
+                claimed = (
+                    match_slots.filter(pk=slot_id, volunteer__isnull=True)
+                    .exclude(Exists(match_slots.filter(volunteer=user)))
+                    .update(volunteer=user)
+                )
+        except IntegrityError:
+            # lost a race against our own double-click: the unique constraint caught it
+            claimed = 0
+
+        if not claimed:
+            raise SlotUnavailable(_claim_failure_reason(user, match_id))
+        # queryset updates skip post_save, so invalidate and publish by hand
+        invalidate("calendar", f"match:{match_id}", f"volunteer:{user.pk}")
+        slot_event(slot_id, match_id, user.pk)
+    return slot_id
+
+
+def _claim_failure_reason(user, match_id):
+    # only runs on the failure path, so the happy path stays at one UPDATE per table
+    slots = VolunteerSlot.objects.filter(match_id=match_id)
+    if slots.filter(volunteer=user).exists():
+        return "You are already volunteering for this match."
+    capacity = Match.objects.filter(pk=match_id).values_list("capacity", flat=True).first()
+    if capacity is not None and slots.filter(volunteer__isnull=False).count() >= capacity:
+        return f"This match already has {capacity} volunteers."
+    return "This slot is already taken."
+
+
+class OfferUnavailable(Exception):
+    """An offer could not be accepted; the message is meant to be shown to the user."""
+
+
+def accept_offer(user, offer_id):
+    """
+    Accept an open offer on behalf of ``user`` and return it.
+
+    The offer and every slot it touches are locked in one transaction, so two
+    people accepting the same offer at once cannot both succeed.
+
+    - "trade": the accepter takes over the offered slot.
+    - "time": the accepter must already hold a slot in the match; they move
+      into the offered slot and their previous slot opens up.
+
+    The offer moves to "accepted", and any other open offer on a slot that
+    changed hands is cancelled because it no longer describes reality.
+
+    Raises OfferUnavailable when the offer cannot be accepted.
+    """
+    with transaction.atomic():
+        offer = (
+            Offer.objects.select_for_update(of=("self",))
+            .select_related("slot__match__home_team")
+            .filter(pk=offer_id, status="open")
+            .first()
+        )
+        if offer is None:
+            raise OfferUnavailable("This offer is no longer open.")
+        if offer.user_id == user.pk:
+            raise OfferUnavailable("You can't accept your own offer.")
+
+        match = offer.slot.match
+        profile = Profile.for_user(user)
+        if profile.home_team_id and (
+            match.home_team_id == profile.home_team_id or match.guest_team == profile.home_team.name
+        ):
+            raise OfferUnavailable("Can't accept, you are playing!")
+
+        slots = {
+            slot.pk: slot
+            for slot in VolunteerSlot.objects.select_for_update().filter(
+                Q(pk=offer.slot_id) | Q(match=match, volunteer=user)
+            )
+        }
+        offered = slots.pop(offer.slot_id)
+        if offered.volunteer_id != offer.user_id:
+            raise OfferUnavailable("This slot has changed hands since the offer was made.")
+        own_slot = next(iter(slots.values()), None)
+
+        if offer.type == "trade":
+            if own_slot is not None:
+                raise OfferUnavailable("You already volunteer for this match.")
+            changed = [offered.pk]
+        else:
+            if own_slot is None:
+                raise OfferUnavailable("You must have a slot in this match to accept the offer.")
+            # free the old slot first, one user holds one slot per match
+            VolunteerSlot.objects.filter(pk=own_slot.pk).update(volunteer=None)
+            # the offerer's slot only changes hands, the freed one opens up
+            count_volunteers({match.pk: -1})
+            changed = [offered.pk, own_slot.pk]
+        VolunteerSlot.objects.filter(pk=offered.pk).update(volunteer=user)
+
+        offer.transition_to("accepted")
+        offer.save(update_fields=["status"])
+        Offer.objects.filter(slot_id__in=changed, status="open").update(status="cancelled")
+        invalidate("calendar", "offers", f"match:{match.pk}", f"volunteer:{offer.user_id}", f"volunteer:{user.pk}")
+        slot_event(offered.pk, match.pk, user.pk)
+        if offer.type == "time":
+            slot_event(own_slot.pk, match.pk, None)
+    return offer
+
+
+def reassign_slots(slot_ids, user=None):
+    """
+    Give the slots to ``user``, or open them up when ``user`` is None, in one
+    UPDATE. Meant for staff: the home team rule and the match capacity are
+    not checked, only that a user holds one slot per match.
+
+    Open offers on those slots are cancelled, whoever made them no longer
+    holds the slot. Returns the number of slots updated; raises
+    SlotUnavailable when the user would get two slots in a match.
+    """
+    with transaction.atomic():
+        slots = VolunteerSlot.objects.filter(pk__in=slot_ids)
+        if user is not None:
+            slots = slots.exclude(volunteer=user)
+        changed = list(slots.values_list("id", "match_id", "volunteer_id"))
+        changed_ids = [pk for pk, match_id, previous in changed]
+        try:
+            with transaction.atomic():
+                updated = VolunteerSlot.objects.filter(pk__in=changed_ids).update(volunteer=user)
+        except IntegrityError:
+            raise SlotUnavailable(f"{user.username} would hold two slots in the same match.")
+        Offer.objects.filter(slot_id__in=changed_ids, status="open").update(status="cancelled")
+        # only slots that were open (assigning) or taken (clearing) change a count
+        changes = {}
+        for pk, match_id, previous in changed:
+            if (previous is None) != (user is None):
+                changes[match_id] = changes.get(match_id, 0) + (1 if user else -1)
+        count_volunteers(changes)
+        volunteers = {previous for pk, match_id, previous in changed if previous} | ({user.pk} if user else set())
+        invalidate(
+            "calendar", "offers",
+            *{f"match:{match_id}" for pk, match_id, previous in changed},
+            *(f"volunteer:{pk}" for pk in volunteers),
+        )
+        for pk, match_id, previous in changed:
+            slot_event(pk, match_id, user.pk if user else None)
+    return updated
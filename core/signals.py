@@ -1,13 +1,101 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from .cache import invalidate
+from .events import publish_on_commit, slot_event
+from .instrumentation import record_query
+from .models import HomeTeam, Match, Offer, Profile, VolunteerSlot
+from .services import count_volunteers, recount_volunteers
 
+# The single place profiles are provisioned. Only new users get one, so
+# routine saves such as the last_login update on every login cost nothing.
+# Profile.for_user() covers accounts created before this receiver existed.
 @receiver(post_save, sender=User)
-def create_profile(sender, instance, created, **kwargs):
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        # CustomSignupForm hands over the profile fields so they go in the same INSERT
+        Profile.objects.create(user=instance, **getattr(instance, "_profile_defaults", {}))
+
+# A new match gets one empty slot per volunteer it needs; a raised capacity adds slots.
+# A full save also writes the counters as they were loaded, so they are recounted.
+@receiver(post_save, sender=Match)
+def create_slots_for_match(sender, instance, created, raw=False, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
+        VolunteerSlot.objects.bulk_create(VolunteerSlot(match=instance) for _ in range(instance.capacity))
+    elif not raw:
+        instance.create_slots()
+        recount_volunteers(Match.objects.filter(pk=instance.pk))
+
+# Match counters for slots saved or deleted one by one (admin, fixtures); the
+# services update them by hand, as they don't go through save()
+@receiver(post_save, sender=VolunteerSlot)
+def count_slot_volunteer(sender, instance, created, **kwargs):
+    if not (created and instance.volunteer_id is None):
+        recount_volunteers(Match.objects.filter(pk=instance.match_id))
+
+@receiver(post_delete, sender=VolunteerSlot)
+def uncount_slot_volunteer(sender, instance, **kwargs):
+    if instance.volunteer_id is not None:
+        recount_volunteers(Match.objects.filter(pk=instance.match_id))
+
+# Deleting a user sets their slots' volunteer to NULL with a queryset update
+@receiver(pre_delete, sender=User)
+def uncount_deleted_volunteer(sender, instance, **kwargs):
+    match_ids = list(instance.volunteer_slots.values_list("match_id", flat=True))
+    count_volunteers(dict.fromkeys(match_ids, -1))
+    invalidate("calendar", *(f"match:{match_id}" for match_id in match_ids))
+
+# Cached data is keyed by version stamps, see core.cache for which model bumps what
+@receiver([post_save, post_delete], sender=Match)
+def invalidate_match_caches(sender, instance, **kwargs):
+    invalidate("calendar", "schedule", f"match:{instance.pk}")
+
+@receiver([post_save, post_delete], sender=VolunteerSlot)
+def invalidate_slot_caches(sender, instance, **kwargs):
+    volunteers = {instance.volunteer_id, getattr(instance, "_loaded_volunteer_id", None)} - {None}
+    invalidate("calendar", f"match:{instance.match_id}", *(f"volunteer:{pk}" for pk in volunteers))
+    instance._loaded_volunteer_id = instance.volunteer_id
+
+# Cards, feeds and offers show usernames, so a rename is a change to every
+# match the user volunteers in
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._loaded_username = instance.__dict__.get("username")
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def invalidate_renamed_volunteer(sender, instance, created, raw=False, **kwargs):
+    if created or raw or instance.username == instance._loaded_username:
+        return
+    instance._loaded_username = instance.username
+    match_ids = set(instance.volunteer_slots.values_list("match_id", flat=True))
+    invalidate("calendar", "offers", f"volunteer:{instance.pk}", *(f"match:{match_id}" for match_id in match_ids))
+
+@receiver([post_save, post_delete], sender=HomeTeam)
+def invalidate_team_caches(sender, **kwargs):
+    invalidate("calendar", "teams")
+
+@receiver([post_save, post_delete], sender=Offer)
+def invalidate_offer_caches(sender, instance, **kwargs):
+    invalidate("offers", f"volunteer:{instance.user_id}")
+
+# Live events for open match boards (core.events). New slots come with a new
+# match, which is a schedule change rather than a slot event.
+@receiver(post_save, sender=VolunteerSlot)
+def publish_slot_change(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        slot_event(instance.pk, instance.match_id, instance.volunteer_id)
+
+@receiver(post_save, sender=Offer)
+def publish_new_offer(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.status == "open":
+        publish_on_commit(
+            "offer-opened",
+            offer_id=instance.pk, slot_id=instance.slot_id, match_id=instance.slot.match_id, type=instance.type,
+        )
+
+# Let QueryBudgetMiddleware count the queries of every connection, in any thread
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -1,8 +1,44 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import tempfile
+import subprocess
+import sys
+import threading
+import time as clock
+import unittest.mock
+
+from asgiref.sync import iscoroutinefunction
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, IntegrityError, OperationalError, transaction
+from django.db.migrations.executor import MigrationExecutor
 from django.contrib.auth.models import User
-from .models import Match, VolunteerSlot, HomeTeam, Offer
-from django.urls import reverse
-from datetime import date, time
+from .models import Match, VolunteerSlot, HomeTeam, Offer, Profile, QueuedEmail
+from .mail import queue_email, send_queued_emails, MAX_ATTEMPTS
+from .feeds import FEED_HISTORY, user_feed_token
+from .utils import calendars_by_user, iter_slot_ics
+from .instrumentation import stats
+from .events import broker, format_event
+from .assignment import Solver, apply_plan, plan_assignments
+from .cache import cache_stats, cached, get_version, get_versions
+from .middleware import QueryBudgetExceeded, QueryBudgetMiddleware
+from .services import OfferUnavailable, SlotUnavailable, accept_offer, claim_slot, drifted_counters, reassign_slots
+from .roster import roster_csv, roster_slots
+from .trades import TradeGraph, execute_trade, find_trades, match_trades
+from django.urls import resolve, reverse
+from django.utils.module_loading import import_string
+from django.utils import timezone
+from datetime import date, time, timedelta
 
 class VolunteerAppTests(TestCase):
 
@@ -88,12 +124,14 @@ class VolunteerAppTests(TestCase):
         self.assertEqual(offer.user, self.user1)
 
     def test_accept_trade_offer(self):
+        self.slot1.volunteer = self.user1
+        self.slot1.save()
         offer = Offer.objects.create(user=self.user1, slot=self.slot1, type="trade", details="Want to swap?")
         self.client.login(username="user2", password="pass")
         response = self.client.post(reverse('accept_offer', args=[offer.id]))
         offer.refresh_from_db()
         self.slot1.refresh_from_db()
-        self.assertEqual(offer.status, "closed")
+        self.assertEqual(offer.status, "accepted")
         self.assertEqual(self.slot1.volunteer, self.user2)
         self.assertRedirects(response, reverse('offer_list'))
 
@@ -112,3 +150,1858 @@ class VolunteerAppTests(TestCase):
         self.assertFalse(Match.objects.filter(id=match_id).exists())
         self.assertFalse(VolunteerSlot.objects.filter(match_id=match_id).exists())
 
+
+class MatchListQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass")
+        self.other = User.objects.create_user(username="user2", password="pass")
+        self.client.login(username="user1", password="pass")
+
+    def add_matches(self, count):
+        for i in range(count):
+            match = Match.objects.create(
+                date=date.today() + timedelta(days=Match.objects.count()),
+                start_time=time(10, 0),
+                home_team=self.team,
+                guest_team=f"Guest {i}",
+            )
+            # one slot taken by someone else, one by the user on every other match
+            slots = list(match.slots.all())
+            slots[0].volunteer = self.other
+            slots[0].save()
+            if i % 2:
+                slots[1].volunteer = self.user
+                slots[1].save()
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("match_list"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.add_matches(2)
+        small = self.count_queries()
+        self.add_matches(20)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_annotations_drive_the_cards(self):
+        self.add_matches(2)
+        response = self.client.get(reverse("match_list"))
+        cards = {item["match"].guest_team: item for item in response.context["match_data"]}
+        self.assertFalse(cards["Guest 0"]["user_signed_up"])
+        self.assertTrue(cards["Guest 1"]["user_signed_up"])
+        self.assertEqual(cards["Guest 0"]["match"].num_volunteers, 1)
+        self.assertEqual(cards["Guest 1"]["match"].num_volunteers, 2)
+        first_open = VolunteerSlot.objects.filter(match__guest_team="Guest 0", volunteer__isnull=True).order_by("id").first()
+        self.assertEqual(cards["Guest 0"]["open_slot_id"], first_open.id)
+        self.assertContains(response, "(1/3)")
+        self.assertContains(response, "user1 (you)")
+
+
+class MatchListPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        User.objects.create_user(username="user1", password="pass")
+        self.client.login(username="user1", password="pass")
+        today = date.today()
+        # three matches a day, from ten days ago to nine days ahead
+        for offset in range(-10, 10):
+            for hour in (18, 10, 14):
+                Match.objects.create(
+                    date=today + timedelta(days=offset),
+                    start_time=time(hour, 0),
+                    home_team=self.team,
+                    guest_team=f"Guest {offset} {hour}",
+                )
+
+    def walk(self, query=""):
+        seen = []
+        url = reverse("match_list") + query
+        while url:
+            response = self.client.get(url)
+            page = [item["match"] for item in response.context["match_data"]]
+            self.assertLessEqual(len(page), 20)
+            seen.extend(page)
+            next_query = response.context["next_query"]
+            url = reverse("match_list") + "?" + next_query if next_query else None
+        return seen
+
+    def test_upcoming_matches_are_paginated_in_order(self):
+        seen = self.walk()
+        self.assertEqual(len(seen), 30)
+        self.assertTrue(all(m.date >= date.today() for m in seen))
+        keys = [(m.date, m.start_time, m.id) for m in seen]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_archive_lists_past_matches_latest_first(self):
+        seen = self.walk("?archive=on")
+        self.assertEqual(len(seen), 30)
+        self.assertTrue(all(m.date < date.today() for m in seen))
+        keys = [(m.date, m.start_time, m.id) for m in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_invalid_cursor_starts_over(self):
+        response = self.client.get(reverse("match_list") + "?after=not-a-cursor")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["match_data"]), 20)
+        self.assertEqual(response.context["match_data"][0]["match"].date, date.today())
+
+
+class IndexUsageTests(TestCase):
+    """The hot lookups must be answerable from the indexes declared in the model Meta."""
+
+    @classmethod
+    def setUpTestData(cls):
+        team = HomeTeam.objects.create(name="Team A")
+        cls.user = User.objects.create_user(username="user1", password="pass")
+        today = date.today()
+        # bulk_create skips the post_save signal, so slots are created explicitly
+        matches = Match.objects.bulk_create(
+            Match(date=today + timedelta(days=i % 365), start_time=time(10 + i % 8, 0),
+                  home_team=team, guest_team=f"Guest {i}")
+            for i in range(2000)
+        )
+        slots = VolunteerSlot.objects.bulk_create(
+            VolunteerSlot(match=match) for match in matches for _ in range(3)
+        )
+        Offer.objects.bulk_create(
+            Offer(user=cls.user, slot=slot, type="trade", status="open" if i % 10 == 0 else "accepted")
+            for i, slot in enumerate(slots[:3000])
+        )
+        cls.match = matches[0]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_match_list_uses_schedule_index(self):
+        queryset = Match.objects.filter(date__gte=date.today()).order_by("date", "start_time", "id")[:21]
+        self.assertUsesIndex(queryset, "match_schedule_idx")
+
+    def test_slot_membership_uses_match_volunteer_index(self):
+        queryset = VolunteerSlot.objects.filter(match=self.match, volunteer=self.user)
+        self.assertUsesIndex(queryset, "slot_match_volunteer_idx", "unique_volunteer_per_match")
+        queryset = VolunteerSlot.objects.filter(match=self.match, volunteer__isnull=True).order_by("id")[:1]
+        self.assertUsesIndex(queryset, "slot_match_volunteer_idx")
+
+    def test_open_match_filters_use_counter_indexes(self):
+        queryset = Match.objects.filter(date__gte=date.today(), open_slots__gt=0).order_by("date", "start_time", "id")[:21]
+        self.assertUsesIndex(queryset, "match_open_schedule_idx")
+        queryset = Match.objects.filter(date__gte=date.today()).order_by("-open_slots", "date", "start_time", "id")[:21]
+        self.assertUsesIndex(queryset, "match_urgency_idx")
+
+    def test_offer_board_uses_status_index(self):
+        queryset = Offer.objects.filter(status="open").order_by("-created_at", "-id")[:21]
+        self.assertUsesIndex(queryset, "offer_status_created_idx")
+
+    def test_user_cannot_hold_two_slots_in_one_match(self):
+        first, second, third = self.match.slots.all()
+        first.volunteer = self.user
+        first.save()
+        second.volunteer = self.user
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            second.save()
+        # open slots are not affected by the constraint
+        self.assertIsNone(third.volunteer)
+        third.save()
+
+
+class BrokenEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError("relay unavailable")
+
+
+class EmailQueueTests(TestCase):
+
+    def setUp(self):
+        team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass", email="user1@example.com")
+        self.match = Match.objects.create(date=date.today(), start_time=time(10, 0), home_team=team, guest_team="Guests")
+        self.slot = self.match.slots.first()
+
+    def test_signup_queues_instead_of_sending(self):
+        self.client.login(username="user1", password="pass")
+        self.client.get(reverse("signup_slot", args=[self.match.id, self.slot.id]))
+        self.assertEqual(len(mail.outbox), 0)
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.to, ["user1@example.com"])
+        self.assertEqual(queued.attachments[0][0], f"volunteering-{self.slot.id}.ics")
+
+        self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].attachments[0][2], "text/calendar")
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, "sent")
+        # nothing left to send
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+    def test_batch_is_sent(self):
+        for i in range(5):
+            queue_email(f"Subject {i}", "Body", to=["a@example.com"])
+        self.assertEqual(send_queued_emails(batch_size=3), (3, 0))
+        self.assertEqual(send_queued_emails(batch_size=3), (2, 0))
+        self.assertEqual(len(mail.outbox), 5)
+
+    @override_settings(EMAIL_BACKEND="core.tests.BrokenEmailBackend")
+    def test_failures_back_off_and_give_up(self):
+        queued = queue_email("Subject", "Body", to=["a@example.com"])
+        self.assertEqual(send_queued_emails(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, "pending")
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("relay unavailable", queued.last_error)
+        self.assertGreater(queued.next_attempt_at, timezone.now())
+        # not due yet
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            QueuedEmail.objects.filter(pk=queued.pk).update(next_attempt_at=timezone.now())
+            send_queued_emails()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, "failed")
+        self.assertEqual(queued.attempts, MAX_ATTEMPTS)
+
+
+class ClaimSlotTests(TestCase):
+
+    def setUp(self):
+        team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass")
+        self.match = Match.objects.create(date=date.today(), start_time=time(10, 0), home_team=team, guest_team="Guests")
+        self.slots = list(self.match.slots.order_by("id"))
+
+    def test_claim_is_one_update_per_table(self):
+        with CaptureQueriesContext(connection) as ctx:
+            claim_slot(self.user, self.match.id, self.slots[0].id)
+        updates = [q["sql"].split()[1] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(sorted(updates), ['"core_match"', '"core_volunteerslot"'])
+        self.slots[0].refresh_from_db()
+        self.assertEqual(self.slots[0].volunteer, self.user)
+        self.match.refresh_from_db()
+        self.assertEqual((self.match.filled_slots, self.match.open_slots), (1, 2))
+
+    def test_taken_slot_and_double_booking_are_refused(self):
+        other = User.objects.create_user(username="user2", password="pass")
+        claim_slot(other, self.match.id, self.slots[0].id)
+        with self.assertRaisesMessage(SlotUnavailable, "already taken"):
+            claim_slot(self.user, self.match.id, self.slots[0].id)
+        claim_slot(self.user, self.match.id, self.slots[1].id)
+        with self.assertRaisesMessage(SlotUnavailable, "already volunteering"):
+            claim_slot(self.user, self.match.id, self.slots[2].id)
+
+    def test_capacity_is_enforced_with_extra_slots(self):
+        extra = VolunteerSlot.objects.create(match=self.match)
+        for i, slot in enumerate(self.slots):
+            claim_slot(User.objects.create_user(username=f"v{i}"), self.match.id, slot.id)
+        with self.assertRaisesMessage(SlotUnavailable, "already has 3 volunteers"):
+            claim_slot(self.user, self.match.id, extra.id)
+
+    def test_any_open_slot(self):
+        self.assertEqual(claim_slot(self.user, self.match.id), self.slots[0].id)
+
+
+def retry_when_locked(func, *args):
+    # SQLite reports lock contention instead of waiting for the lock: try again
+    for _ in range(50):
+        try:
+            return func(*args)
+        except OperationalError:
+            clock.sleep(0.01)
+    return func(*args)
+
+
+def run_in_threads(func, args_list):
+    barrier = threading.Barrier(len(args_list))
+
+    def target(*args):
+        barrier.wait()
+        try:
+            func(*args)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+
+    def test_many_volunteers_racing_for_one_match(self):
+        team = HomeTeam.objects.create(name="Team A")
+        match = Match.objects.create(date=date.today(), start_time=time(10, 0), home_team=team, guest_team="Guests")
+        VolunteerSlot.objects.create(match=match)  # one slot too many, capacity still wins
+        slot_ids = list(match.slots.values_list("id", flat=True))
+        users = [User.objects.create_user(username=f"user{i}") for i in range(12)]
+        outcomes = []
+
+        def volunteer(user, index):
+            # everybody double-clicks: the same user tries two slots
+            for slot_id in (slot_ids[index % 4], slot_ids[(index + 1) % 4]):
+                try:
+                    retry_when_locked(claim_slot, user, match.id, slot_id)
+                    outcomes.append(user.id)
+                except SlotUnavailable:
+                    pass
+
+        run_in_threads(volunteer, [(user, i) for i, user in enumerate(users)])
+
+        assigned = list(match.slots.filter(volunteer__isnull=False).values_list("volunteer_id", flat=True))
+        self.assertEqual(len(assigned), 3)
+        self.assertEqual(len(set(assigned)), 3)
+        self.assertEqual(sorted(outcomes), sorted(assigned))
+
+
+class AcceptOfferTests(TestCase):
+
+    def setUp(self):
+        self.team_a = HomeTeam.objects.create(name="Team A")
+        self.team_b = HomeTeam.objects.create(name="Team B")
+        self.offerer = User.objects.create_user(username="offerer", password="pass")
+        self.accepter = User.objects.create_user(username="accepter", password="pass")
+        self.match = Match.objects.create(date=date.today(), start_time=time(10, 0), home_team=self.team_a, guest_team="Team B")
+        self.slots = list(self.match.slots.order_by("id"))
+        self.slots[0].volunteer = self.offerer
+        self.slots[0].save()
+
+    def test_trade_hands_over_the_slot(self):
+        offer = Offer.objects.create(user=self.offerer, slot=self.slots[0], type="trade")
+        duplicate = Offer.objects.create(user=self.offerer, slot=self.slots[0], type="time")
+        accept_offer(self.accepter, offer.id)
+        offer.refresh_from_db()
+        duplicate.refresh_from_db()
+        self.slots[0].refresh_from_db()
+        self.assertEqual(self.slots[0].volunteer, self.accepter)
+        self.assertEqual(offer.status, "accepted")
+        self.assertEqual(duplicate.status, "cancelled")
+        with self.assertRaisesMessage(OfferUnavailable, "no longer open"):
+            accept_offer(self.accepter, offer.id)
+
+    def test_time_offer_keeps_one_slot_per_user(self):
+        self.slots[1].volunteer = self.accepter
+        self.slots[1].save()
+        offer = Offer.objects.create(user=self.offerer, slot=self.slots[0], type="time")
+        accept_offer(self.accepter, offer.id)
+        volunteers = list(self.match.slots.order_by("id").values_list("volunteer", flat=True))
+        self.assertEqual(volunteers, [self.accepter.id, None, None])
+        self.match.refresh_from_db()
+        self.assertEqual((self.match.filled_slots, self.match.open_slots), (1, 2))
+        self.assertFalse(drifted_counters(Match.objects.all()).exists())
+
+    def test_rules_are_checked(self):
+        offer = Offer.objects.create(user=self.offerer, slot=self.slots[0], type="trade")
+        with self.assertRaisesMessage(OfferUnavailable, "your own offer"):
+            accept_offer(self.offerer, offer.id)
+        # the accepter plays for the guest team
+        self.accepter.profile.home_team = self.team_b
+        self.accepter.profile.save()
+        with self.assertRaisesMessage(OfferUnavailable, "you are playing"):
+            accept_offer(self.accepter, offer.id)
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, "open")
+
+    def test_status_machine(self):
+        offer = Offer(status="accepted")
+        offer.transition_to("completed")
+        with self.assertRaises(ValueError):
+            offer.transition_to("open")
+
+
+class ConcurrentAcceptTests(TransactionTestCase):
+
+    def test_only_one_accepter_wins(self):
+        team = HomeTeam.objects.create(name="Team A")
+        match = Match.objects.create(date=date.today(), start_time=time(10, 0), home_team=team, guest_team="Guests")
+        offerer = User.objects.create_user(username="offerer")
+        slot = match.slots.first()
+        slot.volunteer = offerer
+        slot.save()
+        offer = Offer.objects.create(user=offerer, slot=slot, type="trade")
+        users = [User.objects.create_user(username=f"user{i}") for i in range(10)]
+        winners = []
+
+        def accept(user):
+            try:
+                retry_when_locked(accept_offer, user, offer.id)
+                winners.append(user.id)
+            except OfferUnavailable:
+                pass
+
+        run_in_threads(accept, [(user,) for user in users])
+
+        self.assertEqual(len(winners), 1)
+        slot.refresh_from_db()
+        self.assertEqual(slot.volunteer_id, winners[0])
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, "accepted")
+
+
+class CalendarFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass")
+        self.match = Match.objects.create(date=date.today() + timedelta(days=3), start_time=time(10, 0),
+                                          home_team=self.team, guest_team="Guests")
+        self.slot = self.match.slots.order_by("id").first()
+        self.url = reverse("user_calendar", args=[user_feed_token(self.user)])
+
+    def test_user_feed_lists_own_slots(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            claim_slot(self.user, self.match.id, self.slot.id)
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertContains(response, f"UID:slot-{self.slot.id}@volunteer-app")
+        self.assertContains(response, "Volunteering for Team A vs Guests")
+
+    def test_profile_shows_subscription_url(self):
+        self.client.login(username="user1", password="pass")
+        self.assertContains(self.client.get(reverse("profile")), self.url)
+
+    def test_bad_token_is_404(self):
+        self.assertEqual(self.client.get(reverse("user_calendar", args=["5:forged"])).status_code, 404)
+
+    def test_conditional_get_and_cache(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        # warm: no queries, and a 304 for clients that already have it
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        # a change to the user's slots produces a new feed
+        with self.captureOnCommitCallbacks(execute=True):
+            claim_slot(self.user, self.match.id, self.slot.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "Team A vs Guests")
+
+    def test_window_moves_without_writes(self):
+        past = Match.objects.create(date=date.today() - FEED_HISTORY, start_time=time(10, 0),
+                                    home_team=self.team, guest_team="Old guests")
+        claim_slot(self.user, past.id)
+        response = self.client.get(self.url)
+        self.assertContains(response, "Team A vs Old guests")
+
+        # a day later the match is out of the window, though nothing was written
+        with unittest.mock.patch("django.utils.timezone.localdate", return_value=date.today() + timedelta(days=1)):
+            fresh = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(fresh.status_code, 200)
+            self.assertNotContains(fresh, "Old guests")
+            fresh = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(fresh.status_code, 200)
+
+    def test_team_feed_follows_slot_saves(self):
+        url = reverse("team_calendar", args=[self.team.id])
+        self.assertContains(self.client.get(url), "Volunteers: none yet")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.slot.volunteer = self.user
+            self.slot.save()
+        self.assertContains(self.client.get(url), "Volunteers: user1")
+        self.assertEqual(self.client.get(reverse("team_calendar", args=[999])).status_code, 404)
+
+
+class ImportFixturesTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        HomeTeam.objects.create(name="SMZ1")
+
+    def write_csv(self, rows):
+        path = f"{self.tmp.name}/season.csv"
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["date", "start_time", "home_team", "guest_team", "location"])
+            writer.writerows(rows)
+        return path
+
+    def season(self, count, location="Hall"):
+        start = date(2030, 9, 1)
+        return [
+            [(start + timedelta(days=i // 4)).isoformat(), f"{10 + 2 * (i % 4)}:00",
+             f"Team {i % 20}", f"Guest {i}", location]
+            for i in range(count)
+        ]
+
+    def test_full_season_is_batched(self):
+        path = self.write_csv(self.season(2000))
+        with CaptureQueriesContext(connection) as ctx:
+            call_command("import_fixtures", path, "--create-teams", stdout=io.StringIO())
+
+        self.assertEqual(Match.objects.count(), 2000)
+        self.assertEqual(VolunteerSlot.objects.count(), 6000)
+        # one query per new team plus a handful per batch, not thousands of round trips
+        self.assertLess(len(ctx.captured_queries), 60)
+
+    def test_reimport_updates_in_place(self):
+        call_command("import_fixtures", self.write_csv(self.season(40)), "--create-teams", stdout=io.StringIO())
+        call_command("import_fixtures", self.write_csv(self.season(40, "Stadium")), stdout=io.StringIO())
+        self.assertEqual(Match.objects.count(), 40)
+        self.assertEqual(VolunteerSlot.objects.count(), 120)
+        self.assertFalse(Match.objects.exclude(location="Stadium").exists())
+
+    def test_json_lines_and_unknown_team(self):
+        path = f"{self.tmp.name}/season.jsonl"
+        with open(path, "w") as f:
+            f.write(json.dumps({"date": "2030-09-01", "start_time": "10:00", "home_team": "SMZ1", "guest_team": "X"}) + "\n")
+        call_command("import_fixtures", path, stdout=io.StringIO())
+        self.assertEqual(Match.objects.get().slots.count(), 3)
+
+        with open(path, "w") as f:
+            f.write(json.dumps({"date": "2030-09-02", "start_time": "10:00", "home_team": "Nope", "guest_team": "X"}) + "\n")
+        with self.assertRaisesMessage(CommandError, "unknown home team"):
+            call_command("import_fixtures", path)
+
+
+class KickoffMigrationTests(TransactionTestCase):
+    """0008 adds unique_home_team_kickoff to databases that may hold duplicate matches."""
+
+    before = [("core", "0007_offer_status_transitions")]
+    after = [("core", "0008_unique_home_team_kickoff")]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        self.Match = apps.get_model("core", "Match")
+        self.VolunteerSlot = apps.get_model("core", "VolunteerSlot")
+        self.Offer = apps.get_model("core", "Offer")
+        team = apps.get_model("core", "HomeTeam").objects.create(name="Team A")
+        self.users = [apps.get_model("auth", "User").objects.create(username=f"user{i}") for i in range(3)]
+        self.kickoff = {"home_team": team, "date": date.today(), "start_time": time(10, 0)}
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def add_match(self, volunteers, **fields):
+        match = self.Match.objects.create(**self.kickoff, guest_team="Guests", **fields)
+        for volunteer in volunteers + [None] * (3 - len(volunteers)):
+            self.VolunteerSlot.objects.create(match=match, volunteer=volunteer)
+        return match
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+
+    def test_duplicates_are_merged_into_the_oldest_match(self):
+        first, second, third = self.users
+        kept = self.add_match([first])
+        duplicate = self.add_match([first, second])
+        self.add_match([third])
+        moved = self.VolunteerSlot.objects.get(match=duplicate, volunteer=second)
+        offer = self.Offer.objects.create(user=second, slot=moved, type="trade")
+        self.migrate()
+
+        self.assertEqual(list(self.Match.objects.values_list("id", flat=True)), [kept.id])
+        volunteers = self.VolunteerSlot.objects.filter(match=kept).order_by("id").values_list("volunteer_id", flat=True)
+        self.assertEqual(list(volunteers), [first.id, second.id, third.id])
+        self.assertTrue(self.Offer.objects.filter(pk=offer.pk, slot=moved).exists())
+
+    def test_duplicates_with_volunteers_and_offers(self):
+        first, second, third = self.users
+        kept = self.add_match([first, third])
+        duplicate = self.add_match([first, second])
+        def offer(match, user, kind):
+            slot = self.VolunteerSlot.objects.get(match=match, volunteer=user)
+            return self.Offer.objects.create(user=user, slot=slot, type=kind)
+
+        kept_offer = offer(kept, third, "time")
+        offer(duplicate, first, "trade")  # first keeps their slot in kept, this one goes
+        moved = offer(duplicate, second, "trade")
+        self.migrate()
+
+        # the merge commits before the ALTER TABLE (PostgreSQL refuses it with pending trigger events)
+        migration = MigrationExecutor(connection).loader.get_migration(*self.after[0])
+        self.assertFalse(migration.atomic)
+        self.assertTrue(migration.operations[0].atomic)
+
+        self.assertFalse(self.Match.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(self.VolunteerSlot.objects.filter(match=kept).count(), 3)
+        offers = set(self.Offer.objects.values_list("pk", "slot__match"))
+        self.assertEqual(offers, {(kept_offer.pk, kept.pk), (moved.pk, kept.pk)})
+
+    def test_conflicting_duplicates_stop_the_migration(self):
+        kept = self.add_match([])
+        other = self.add_match([], location="Other hall")
+        with self.assertRaisesMessage(RuntimeError, f"(match ids): {kept.id}, {other.id}"):
+            self.migrate()
+        self.assertEqual(self.Match.objects.count(), 2)
+        other.delete()  # so tearDown can migrate forward again
+
+
+class ProfileProvisioningTests(TestCase):
+
+    def profile_writes(self, ctx):
+        return [
+            q["sql"].split()[0] for q in ctx.captured_queries
+            if "core_profile" in q["sql"] and not q["sql"].startswith("SELECT")
+        ]
+
+    def test_signup_creates_profile_in_one_insert(self):
+        team = HomeTeam.objects.create(name="Team A")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse("signup"), {
+                "username": "newbie", "email": "newbie@example.com", "first_name": "New", "last_name": "Bie",
+                "phone_number": "079 123 45 67", "home_team": team.id,
+                "password1": "a-long-passphrase", "password2": "a-long-passphrase",
+            })
+        self.assertRedirects(response, reverse("match_list"), fetch_redirect_response=False)
+        self.assertEqual(self.profile_writes(ctx), ["INSERT"])
+        profile = Profile.objects.get(user__username="newbie")
+        self.assertEqual(profile.home_team, team)
+        self.assertEqual(profile.phone_number, "079 123 45 67")
+
+    def test_login_does_not_touch_profile(self):
+        User.objects.create_user(username="user1", password="pass")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(self.client.login(username="user1", password="pass"))
+        self.assertEqual(self.profile_writes(ctx), [])
+
+    def test_missing_profile_is_created_lazily(self):
+        user = User.objects.create_user(username="user1", password="pass")
+        Profile.objects.filter(user=user).delete()
+        user = User.objects.get(pk=user.pk)
+        profile = Profile.for_user(user)
+        self.assertEqual(profile.user, user)
+        # cached on the user from now on
+        with self.assertNumQueries(0):
+            self.assertIs(Profile.for_user(user), profile)
+
+    def test_unchanged_profile_form_does_not_write(self):
+        User.objects.create_user(username="user1", password="pass", first_name="A", last_name="B", email="a@b.ch")
+        self.client.login(username="user1", password="pass")
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("edit_profile"), {
+                "first_name": "A", "last_name": "B", "email": "a@b.ch", "phone_number": "", "home_team": "",
+            })
+        self.assertEqual(self.profile_writes(ctx), [])
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith("UPDATE \"auth_user\"")])
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(TestCase):
+
+    def setUp(self):
+        stats.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.staff = User.objects.create_user(username="staff", password="pass", is_staff=True)
+        self.user = User.objects.create_user(username="user1", password="pass")
+        for i in range(5):
+            Match.objects.create(date=date.today() + timedelta(days=i), start_time=time(10, 0),
+                                 home_team=self.team, guest_team=f"Guest {i}")
+
+    def test_hot_views_stay_within_budget(self):
+        self.client.login(username="user1", password="pass")
+        match = Match.objects.first()
+        slot = match.slots.first()
+        self.client.get(reverse("match_list"))
+        self.client.get(reverse("offer_list"))
+        self.client.get(reverse("signup_slot", args=[match.id, slot.id]))
+        offer = Offer.objects.create(user=self.user, slot=slot, type="trade")
+        self.client.login(username="staff", password="pass")
+        self.client.post(reverse("accept_offer", args=[offer.id]))
+        self.assertEqual(
+            sorted(stats.summary()), ["accept_offer", "match_list", "offer_list", "signup_slot"]
+        )
+
+    @override_settings(QUERY_BUDGETS={"match_list": 1})
+    def test_over_budget_fails(self):
+        self.client.login(username="user1", password="pass")
+        with self.assertRaisesMessage(QueryBudgetExceeded, "match_list ran"):
+            self.client.get(reverse("match_list"))
+
+    def test_server_timing_and_summary_for_staff(self):
+        self.client.login(username="user1", password="pass")
+        response = self.client.get(reverse("match_list"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(self.client.get(reverse("request_metrics")).status_code, 302)
+
+        self.client.login(username="staff", password="pass")
+        response = self.client.get(reverse("match_list"))
+        self.assertRegex(response["Server-Timing"], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+')
+        summary = self.client.get(reverse("request_metrics")).json()
+        self.assertEqual(summary["match_list"]["requests"], 2)
+        self.assertGreater(summary["match_list"]["queries_avg"], 0)
+        self.assertGreater(summary["match_list"]["template_ms_avg"], 0)
+
+    async def test_async_mode(self):
+        # under ASGI it must stay a coroutine, or the whole chain runs in a thread
+        async def view(request):
+            await Match.objects.acount()
+            return HttpResponse()
+
+        middleware = QueryBudgetMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get(reverse("match_list"))
+        request.resolver_match = resolve(reverse("match_list"))
+        with self.settings(DEBUG=True):
+            response = await middleware(request)
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+        self.assertEqual(stats.summary()["match_list"]["requests"], 1)
+
+
+class OfferListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        team = HomeTeam.objects.create(name="Team A")
+        cls.users = User.objects.bulk_create(User(username=f"user{i}") for i in range(50))
+        matches = Match.objects.bulk_create(
+            Match(date=date.today() + timedelta(days=i), start_time=time(10, 0), home_team=team, guest_team=f"Guest {i}")
+            for i in range(200)
+        )
+        slots = VolunteerSlot.objects.bulk_create(
+            VolunteerSlot(match=match, volunteer=cls.users[(i + n) % 50]) for i, match in enumerate(matches) for n in range(3)
+        )
+        cls.offers = Offer.objects.bulk_create(
+            Offer(user=slot.volunteer, slot=slot, type="trade", status="open" if i % 5 else "accepted")
+            for i, slot in enumerate(slots[:500])
+        )
+        User.objects.create_user(username="viewer", password="pass")
+
+    def setUp(self):
+        self.client.login(username="viewer", password="pass")
+
+    def count_queries(self, query=""):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("offer_list") + query)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_bounded_queries_over_500_offers(self):
+        queries, response = self.count_queries("?status=all")
+        self.assertEqual(len(response.context["offers"]), 25)
+        self.assertLessEqual(queries, 4)
+        Offer.objects.filter(pk__in=[o.pk for o in self.offers[5:]]).delete()
+        self.assertEqual(self.count_queries("?status=all")[0], queries)
+
+    def test_pages_cover_every_open_offer_newest_first(self):
+        seen = []
+        query = ""
+        while query is not None:
+            response = self.client.get(reverse("offer_list") + query)
+            seen.extend(response.context["offers"])
+            next_query = response.context["next_query"]
+            query = "?" + next_query if next_query else None
+        self.assertEqual(len(seen), 400)
+        self.assertTrue(all(offer.status == "open" for offer in seen))
+        keys = [(offer.created_at, offer.id) for offer in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_closed_filter_shows_finished_offers(self):
+        response = self.client.get(reverse("offer_list") + "?status=closed")
+        self.assertTrue(response.context["offers"])
+        self.assertTrue(all(offer.status == "accepted" for offer in response.context["offers"]))
+        self.assertContains(response, "Offer accepted")
+
+
+class MatchBoardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass")
+        self.other = User.objects.create_user(username="user2", password="pass")
+        self.matches = [
+            Match.objects.create(date=date.today() + timedelta(days=i), start_time=time(10, 0),
+                                 home_team=self.team, guest_team=f"Guest {i}")
+            for i in range(10)
+        ]
+        self.client.login(username="user1", password="pass")
+
+    def test_warm_page_only_reads_the_users_own_data(self):
+        self.client.get(reverse("match_list"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("match_list"))
+        tables = {q["sql"].split(" FROM ")[1].split()[0].strip('"') for q in ctx.captured_queries}
+        # session and user come from authentication, the rest is the user's own profile and slots
+        self.assertEqual(tables, {"django_session", "auth_user", "core_profile", "core_volunteerslot"})
+        self.assertEqual(len(response.context["match_data"]), 10)
+
+    def test_cards_follow_slot_changes(self):
+        match = self.matches[0]
+        self.client.get(reverse("match_list"))
+        claim_slot(self.other, match.id)
+        response = self.client.get(reverse("match_list"))
+        self.assertContains(response, "(1/3)")
+        self.assertContains(response, "user2")
+        self.assertNotContains(response, "user2 (you)")
+
+        claim_slot(self.user, match.id)
+        response = self.client.get(reverse("match_list"))
+        self.assertContains(response, "user1 (you)")
+        self.assertContains(response, "(2/3)")
+        item = response.context["match_data"][0]
+        self.assertTrue(item["user_signed_up"])
+        self.assertEqual(item["user_slot_id"], match.slots.get(volunteer=self.user).id)
+
+        # the same cached card is shown to the other volunteer with their own overlay
+        self.client.login(username="user2", password="pass")
+        response = self.client.get(reverse("match_list"))
+        self.assertContains(response, "user2 (you)")
+        self.assertNotContains(response, "user1 (you)")
+
+    def test_schedule_and_team_changes_show_up(self):
+        self.client.get(reverse("match_list"))
+        Match.objects.create(date=date.today(), start_time=time(8, 0), home_team=self.team, guest_team="Newcomers")
+        self.assertContains(self.client.get(reverse("match_list")), "Team A vs Newcomers")
+        self.team.name = "Team Renamed"
+        self.team.save()
+        response = self.client.get(reverse("match_list"))
+        self.assertContains(response, "Team Renamed vs Guest 0")
+        self.assertIn("Team Renamed", response.context["teams"])
+
+    def test_cards_follow_username_changes(self):
+        claim_slot(self.other, self.matches[0].id)
+        self.assertContains(self.client.get(reverse("match_list")), "user2")
+        self.other.username = "renamed"
+        self.other.save()
+        response = self.client.get(reverse("match_list"))
+        self.assertContains(response, "renamed")
+        self.assertNotContains(response, "user2")
+
+    def test_team_filter_follows_renames(self):
+        response = self.client.get(reverse("match_list"), {"team": "Team A"})
+        self.assertEqual(len(response.context["match_data"]), 10)
+        self.team.name = "Team Renamed"
+        self.team.save()
+        response = self.client.get(reverse("match_list"), {"team": "Team A"})
+        self.assertEqual(response.context["match_data"], [])
+
+
+class VersionedCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass")
+        self.other = User.objects.create_user(username="user2", password="pass")
+        self.match = Match.objects.create(date=date.today() + timedelta(days=2), start_time=time(10, 0),
+                                          home_team=self.team, guest_team="Guests")
+
+    def test_cached_counts_hits_and_misses(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return None  # None is a value like any other
+
+        versions = get_versions(["teams"])
+        self.assertIsNone(cached("test", "key", versions, build))
+        self.assertIsNone(cached("test", "key", versions, build))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache_stats.summary()["test"], {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_each_model_bumps_its_versions(self):
+        slot = self.match.slots.first()
+        offer = Offer.objects.create(user=self.user, slot=slot, type="trade")
+        cases = [
+            (lambda: self.team.save(), ["teams", "calendar"]),
+            (lambda: self.match.save(), ["schedule", "calendar", f"match:{self.match.pk}"]),
+            (lambda: slot.save(), ["calendar", f"match:{self.match.pk}"]),
+            (lambda: offer.save(), ["offers"]),
+            (lambda: offer.delete(), ["offers"]),
+        ]
+        for write, names in cases:
+            before = get_versions(names)
+            clock.sleep(0.01)
+            write()
+            after = get_versions(names)
+            for name in names:
+                self.assertGreater(after[name], before[name], name)
+
+    def test_accepting_an_offer_bumps_offers(self):
+        slot = self.match.slots.first()
+        slot.volunteer = self.user
+        slot.save()
+        offer = Offer.objects.create(user=self.user, slot=slot, type="trade")
+        before = get_version("offers")
+        clock.sleep(0.01)
+        accept_offer(self.other, offer.id)
+        self.assertGreater(get_version("offers"), before)
+
+    def assert_never_stale(self):
+        cache.clear()
+        self.client.login(username="user1", password="pass")
+        feed = reverse("team_calendar", args=[self.team.id])
+        self.assertContains(self.client.get(reverse("match_list")), "(0/3)")
+        self.assertContains(self.client.get(feed), "Volunteers: none yet")
+
+        claim_slot(self.other, self.match.id)
+        self.assertContains(self.client.get(reverse("match_list")), "(1/3)")
+        self.assertContains(self.client.get(feed), "Volunteers: user2")
+
+        self.match.guest_team = "Renamed Guests"
+        self.match.save()
+        self.assertContains(self.client.get(reverse("match_list")), "Team A vs Renamed Guests")
+        self.assertContains(self.client.get(feed), "Team A vs Renamed Guests")
+
+        self.match.slots.filter(volunteer=self.other).first().delete()
+        self.assertNotContains(self.client.get(reverse("match_list")), "user2")
+
+    def test_never_stale_with_default_cache(self):
+        self.assert_never_stale()
+
+    def test_never_stale_with_locmem(self):
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assert_never_stale()
+
+    def test_command_writes_show_up(self):
+        self.client.login(username="user1", password="pass")
+        self.assertContains(self.client.get(reverse("match_list")), "(0/3)")
+        # a write that bypasses the counters, then the command that repairs them
+        VolunteerSlot.objects.filter(pk=self.match.slots.order_by("id")[0].pk).update(volunteer=self.other)
+        self.assertContains(self.client.get(reverse("match_list")), "(0/3)")
+        call_command("repair_match_counters", stdout=io.StringIO())
+        self.assertContains(self.client.get(reverse("match_list")), "(1/3)")
+
+    def test_default_cache_is_shared_between_processes(self):
+        # commands run in their own process; their version bumps must reach the web workers
+        before = get_version("schedule")
+        subprocess.run(
+            [sys.executable, "manage.py", "shell", "-c", "from core.cache import bump_version; bump_version('schedule')"],
+            cwd=settings.BASE_DIR, check=True, capture_output=True,
+        )
+        self.assertNotEqual(get_version("schedule"), before)
+
+    def test_never_stale_with_file_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.settings(CACHES={"default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": tmp,
+            }}):
+                self.assert_never_stale()
+
+    def test_metrics_for_staff(self):
+        User.objects.create_user(username="staff", password="pass", is_staff=True)
+        self.client.login(username="user1", password="pass")
+        self.client.get(reverse("match_list"))
+        self.client.get(reverse("match_list"))
+        self.assertEqual(self.client.get(reverse("cache_metrics")).status_code, 302)
+
+        self.client.login(username="staff", password="pass")
+        summary = self.client.get(reverse("cache_metrics")).json()
+        self.assertEqual(summary["board:card"], {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+
+class JsonApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass")
+        self.match = Match.objects.create(date=date.today() + timedelta(days=2), start_time=time(10, 0),
+                                          home_team=self.team, guest_team="Guests", location="Hall")
+        Match.objects.create(date=date.today() - timedelta(days=2), start_time=time(10, 0),
+                             home_team=self.team, guest_team="Past")
+
+    def test_matches_with_occupancy(self):
+        claim_slot(self.user, self.match.id)
+        data = self.client.get(reverse("api_matches")).json()
+        self.assertEqual(data["matches"], [{
+            "id": self.match.id, "date": str(self.match.date), "start_time": "10:00:00",
+            "home_team_id": self.team.id, "home_team_name": "Team A", "guest_team": "Guests",
+            "location": "Hall", "filled": 1, "capacity": 3,
+        }])
+        self.assertEqual(self.client.get(reverse("api_matches"), {"team": self.team.id + 1}).json(), {"matches": []})
+        self.assertEqual(self.client.get(reverse("api_matches"), {"team": "Team A"}).status_code, 400)
+
+    def test_polling_gets_304_without_queries(self):
+        response = self.client.get(reverse("api_matches"))
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("api_matches"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # an unchanged 200 comes from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse("api_matches")).status_code, 200)
+
+        claim_slot(self.user, self.match.id)
+        response = self.client.get(reverse("api_matches"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["matches"][0]["filled"], 1)
+
+    def test_offers_and_assignments_need_login(self):
+        self.assertEqual(self.client.get(reverse("api_offers")).status_code, 401)
+        self.assertEqual(self.client.get(reverse("api_my_assignments")).status_code, 401)
+
+    def test_offers_follow_offer_changes(self):
+        other = User.objects.create_user(username="user2", password="pass")
+        slot_id = claim_slot(self.user, self.match.id)
+        self.client.login(username="user2", password="pass")
+        response = self.client.get(reverse("api_offers"))
+        self.assertEqual(response.json(), {"offers": []})
+        self.assertIn("Cookie", response["Vary"])
+
+        offer = Offer.objects.create(user=self.user, slot_id=slot_id, type="trade")
+        response = self.client.get(reverse("api_offers"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()["offers"]
+        self.assertEqual((row["id"], row["user"], row["match_id"]), (offer.id, "user1", self.match.id))
+
+        accept_offer(other, offer.id)
+        self.assertEqual(self.client.get(reverse("api_offers")).json(), {"offers": []})
+
+    def test_my_assignments(self):
+        slot_id = claim_slot(self.user, self.match.id)
+        self.client.login(username="user1", password="pass")
+        [row] = self.client.get(reverse("api_my_assignments")).json()["assignments"]
+        self.assertEqual((row["id"], row["match_id"], row["guest_team"]), (slot_id, self.match.id, "Guests"))
+
+        # other users get their own, empty list
+        User.objects.create_user(username="user2", password="pass")
+        self.client.login(username="user2", password="pass")
+        self.assertEqual(self.client.get(reverse("api_my_assignments")).json(), {"assignments": []})
+
+
+class LiveEventsTests(TestCase):
+
+    def setUp(self):
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass")
+        self.other = User.objects.create_user(username="user2", password="pass")
+        self.match = Match.objects.create(date=date.today() + timedelta(days=2), start_time=time(10, 0),
+                                          home_team=self.team, guest_team="Guests")
+
+    def published(self, write):
+        before = len(broker.history) and broker.history[-1][0]
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        return [(kind, data) for event_id, kind, data in broker.history if event_id > before]
+
+    def test_writes_publish_after_commit(self):
+        slot = self.match.slots.order_by("id").first()
+        with self.captureOnCommitCallbacks() as callbacks:
+            claim_slot(self.user, self.match.id, slot.id)
+        self.assertEqual(len(callbacks), 2)  # nothing is sent before the commit
+
+        events = self.published(lambda: claim_slot(self.other, self.match.id))
+        self.assertEqual(events[0][0], "slot-claimed")
+        self.assertEqual(events[0][1]["match_id"], self.match.id)
+
+        offer = None
+
+        def open_offer():
+            nonlocal offer
+            offer = Offer.objects.create(user=self.user, slot=slot, type="time")
+        events = self.published(open_offer)
+        self.assertEqual(events, [("offer-opened", {
+            "offer_id": offer.id, "slot_id": slot.id, "match_id": self.match.id, "type": "time",
+        })])
+
+        # a time swap moves user2 into the offered slot and frees their old one
+        events = self.published(lambda: accept_offer(self.other, offer.id))
+        self.assertEqual([kind for kind, data in events], ["slot-claimed", "slot-freed"])
+
+        events = self.published(lambda: VolunteerSlot.objects.filter(pk=slot.pk).first().save())
+        self.assertEqual(events, [("slot-claimed", {"slot_id": slot.id, "match_id": self.match.id})])
+
+    def test_broker_fans_out_and_replays(self):
+        async def scenario():
+            first, _ = broker.subscribe()
+            second, _ = broker.subscribe()
+            # published from another thread, as sync views do
+            await asyncio.to_thread(broker.publish, "slot-freed", {"slot_id": 1})
+            received = [await asyncio.wait_for(s.queue.get(), 1) for s in (first, second)]
+            latest = broker.publish("slot-freed", {"slot_id": 2})
+            late, missed = broker.subscribe(last_id=received[0][0])
+            for subscription in (first, second, late):
+                broker.unsubscribe(subscription)
+            return received, latest, missed
+
+        received, latest, missed = asyncio.run(scenario())
+        self.assertEqual(received[0], received[1])
+        self.assertEqual(missed, [latest])
+        self.assertEqual(format_event(latest), f'id: {latest[0]}\nevent: slot-freed\ndata: {{"slot_id":2}}\n\n')
+
+    def test_needs_asgi(self):
+        self.assertEqual(self.client.get(reverse("live_events")).status_code, 501)
+
+    async def test_stream(self):
+        response = await self.async_client.get(reverse("live_events"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        content = response.streaming_content
+        self.assertEqual(await anext(content), b"retry: 5000\n\n")
+        waiting = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)  # let the stream wait on its queue
+        event = await asyncio.to_thread(broker.publish, "slot-freed", {"slot_id": 1, "match_id": self.match.id})
+        self.assertEqual(await asyncio.wait_for(waiting, 1), format_event(event).encode())
+        # a client disconnect cancels the stream, which unsubscribes it
+        waiting = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertFalse(broker.subscribers)
+
+
+class AsyncViewTests(TestCase):
+    """The hot-path views under the ASGI handler, where sync ORM access would raise."""
+
+    def setUp(self):
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1", password="pass", email="u1@example.com")
+        self.other = User.objects.create_user(username="user2", password="pass")
+        self.match = Match.objects.create(date=date.today() + timedelta(days=2), start_time=time(10, 0),
+                                          home_team=self.team, guest_team="Guests")
+
+    async def test_board_signup_and_offers(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("match_list"))
+        self.assertContains(response, "Team A vs Guests")
+        self.assertContains(response, "Hi, user1!")
+
+        slot = await self.match.slots.order_by("id").afirst()
+        response = await self.async_client.get(reverse("signup_slot", args=[self.match.id, slot.id]))
+        self.assertRedirects(response, reverse("match_list"), fetch_redirect_response=False)
+        self.assertEqual(await VolunteerSlot.objects.filter(volunteer=self.user).acount(), 1)
+        self.assertTrue(await QueuedEmail.objects.filter(to=["u1@example.com"]).aexists())
+        response = await self.async_client.get(reverse("signup_slot", args=[self.match.id, 999]))
+        self.assertEqual(response.status_code, 404)
+
+        offer = await Offer.objects.acreate(user=self.user, slot=slot, type="trade")
+        response = await self.async_client.get(reverse("offer_list"))
+        self.assertContains(response, "Guests")
+
+        await self.async_client.aforce_login(self.other)
+        await self.async_client.get(reverse("accept_offer", args=[offer.id]))
+        await offer.arefresh_from_db()
+        self.assertEqual(offer.status, "accepted")
+        response = await self.async_client.get(reverse("offer_list"))
+        self.assertContains(response, "Offer accepted and slots updated.")
+
+    @override_settings(DEBUG=False)
+    async def test_sync_views_with_a_session(self):
+        # the views don't load request.user, the query budget middleware has to, without the sync ORM
+        staff = await User.objects.acreate(username="staff", is_staff=True)
+        await self.async_client.aforce_login(staff)
+        response = await self.async_client.get(reverse("api_matches"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Server-Timing", response)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("team_calendar", args=[self.team.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_middleware_chain_is_async(self):
+        # one sync-only middleware and Django runs every request in a thread
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), "async_capable", False), path)
+
+    async def test_asgi_app_serves_static_files(self):
+        from config.asgi import application
+
+        communicator = ApplicationCommunicator(application, {
+            "type": "http", "method": "GET", "path": "/static/admin/css/base.css", "query_string": b"",
+            "headers": [], "http_version": "1.1", "scheme": "http", "server": ("testserver", 80),
+        })
+        await communicator.send_input({"type": "http.request", "body": b""})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 200)
+        self.assertIn((b"content-type", b"text/css; charset=\"utf-8\""), start["headers"])
+        await communicator.wait()
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+
+    def test_reports_and_compares(self):
+        team = HomeTeam.objects.create(name="Team A")
+        Match.objects.create(date=date.today() + timedelta(days=2), start_time=time(10, 0),
+                             home_team=team, guest_team="Guests")
+        with tempfile.TemporaryDirectory() as tmp:
+            report = f"{tmp}/wsgi.json"
+            args = ["loadtest", "--base-url", self.live_server_url, "--path", "/", "--path", "/api/matches/",
+                    "--requests", "6", "--concurrency", "2"]
+            call_command(*args, "--json", report, stdout=io.StringIO())
+            with open(report) as f:
+                results = json.load(f)
+            self.assertEqual(set(results), {"/", "/api/matches/"})
+            self.assertEqual(results["/"]["errors"], 0)
+            self.assertGreater(results["/"]["rps"], 0)
+
+            out = io.StringIO()
+            call_command(*args, "--compare", report, stdout=out)
+            self.assertIn("x throughput", out.getvalue())
+
+
+class BenchmarkCommandTests(TestCase):
+
+    def test_small_run_and_compare(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            report = f"{tmp}/before.json"
+            args = ["benchmark", "--use-current-db", "--teams", "4", "--matches", "200", "--users", "60",
+                    "--offers", "200", "--iterations", "3"]
+            call_command(*args, "--json", report, stdout=io.StringIO())
+            with open(report) as f:
+                results = json.load(f)["results"]
+            self.assertEqual(set(results), {
+                "match_list", "match_list_team", "match_list_my_matches", "my_schedule", "match_list_archive",
+                "offer_list", "offer_list_closed", "signup_slot", "accept_offer",
+                "ics_user_feed", "ics_team_feed", "ics_batch_all_volunteers", "trade_graph",
+            })
+            self.assertGreater(results["ics_team_feed"]["queries"], 0)
+            self.assertGreater(results["match_list"]["peak_kib"], 0)
+            self.assertEqual(VolunteerSlot.objects.filter(volunteer__username__startswith="bench").count(), 5 + 5)
+
+            # pretend the baseline ran fewer queries
+            for result in results.values():
+                result["queries"] = 0
+            with open(report, "w") as f:
+                json.dump({"results": results}, f)
+            with self.assertRaisesMessage(CommandError, "regression(s)"):
+                call_command(*args, "--keepdb", "--compare", report, "--fail-on-regression", stdout=io.StringIO())
+
+
+class BatchCalendarTests(TestCase):
+
+    def setUp(self):
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.other_team = HomeTeam.objects.create(name="Team B")
+        self.alice = User.objects.create_user(username="alice", password="pass", email="alice@example.com")
+        self.bob = User.objects.create_user(username="bob", password="pass", email="bob@example.com")
+        self.nomail = User.objects.create_user(username="nomail", password="pass")
+        self.slots = []
+        for day, team in enumerate([self.team, self.team, self.other_team], start=1):
+            match = Match.objects.create(date=date.today() + timedelta(days=day), start_time=time(10, 0),
+                                         home_team=team, guest_team=f"Guests {day}")
+            slots = list(match.slots.order_by("id"))
+            for slot, user in zip(slots, [self.alice, self.bob, self.nomail]):
+                slot.volunteer = user
+                slot.save()
+            self.slots += slots
+
+    def test_one_calendar_per_volunteer_in_one_query(self):
+        with self.assertNumQueries(1):
+            calendars = list(calendars_by_user(VolunteerSlot.objects.all()))
+        self.assertEqual([user.username for user, slots, ics in calendars], ["alice", "bob", "nomail"])
+        user, slots, ics = calendars[0]
+        self.assertEqual([slot.match.guest_team for slot in slots], ["Guests 1", "Guests 2", "Guests 3"])
+        self.assertEqual(ics.count(b"BEGIN:VEVENT"), 3)
+        for slot in slots:
+            self.assertIn(f"UID:slot-{slot.id}@volunteer-app".encode(), ics)
+
+    def test_uids_are_stable(self):
+        first = dict((slot.id, ics) for slot, ics in iter_slot_ics(VolunteerSlot.objects.filter(volunteer=self.bob)))
+        second = dict((slot.id, ics) for slot, ics in iter_slot_ics(VolunteerSlot.objects.filter(volunteer=self.bob)))
+        self.assertEqual(len(first), 3)
+        for slot_id, ics in first.items():
+            uid = f"UID:slot-{slot_id}@volunteer-app".encode()
+            self.assertIn(uid, ics)
+            self.assertIn(uid, second[slot_id])
+
+    def test_mail_schedules(self):
+        out = io.StringIO()
+        call_command("mail_schedules", "--dry-run", stdout=out)
+        self.assertIn("Would queue 2", out.getvalue())
+        self.assertFalse(QueuedEmail.objects.exists())
+
+        call_command("mail_schedules", "--team", "Team A", stdout=io.StringIO())
+        emails = {email.to[0]: email for email in QueuedEmail.objects.all()}
+        self.assertEqual(set(emails), {"alice@example.com", "bob@example.com"})
+        email = emails["alice@example.com"]
+        self.assertIn("Team A vs Guests 1", email.body)
+        self.assertNotIn("Guests 3", email.body)
+        [(filename, content, mimetype)] = email.attachments
+        self.assertEqual((filename, mimetype), ("volunteering.ics", "text/calendar"))
+        self.assertEqual(content.count("BEGIN:VEVENT"), 2)
+
+        with self.assertRaises(CommandError):
+            call_command("mail_schedules", "--from", "tomorrow")
+
+
+class SendRemindersTests(TestCase):
+
+    def setUp(self):
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.users = [
+            User.objects.create_user(username=f"user{i}", password="pass", email=f"user{i}@example.com")
+            for i in range(3)
+        ]
+        now = timezone.localtime()
+        soon = now + timedelta(hours=5)
+        later = now + timedelta(days=5)
+        self.soon = Match.objects.create(date=soon.date(), start_time=soon.time().replace(microsecond=0),
+                                         home_team=self.team, guest_team="Soon")
+        self.later = Match.objects.create(date=later.date(), start_time=later.time().replace(microsecond=0),
+                                          home_team=self.team, guest_team="Later")
+        for match in (self.soon, self.later):
+            for slot, user in zip(match.slots.order_by("id"), self.users[:2]):
+                slot.volunteer = user
+                slot.save()
+
+    def test_reminds_once_per_volunteer(self):
+        out = io.StringIO()
+        call_command("send_reminders", "--hours", "24", stdout=out)
+        self.assertIn("Queued 2 reminder(s)", out.getvalue())
+        reminders = QueuedEmail.objects.order_by("id")
+        self.assertEqual([email.to for email in reminders], [["user0@example.com"], ["user1@example.com"]])
+        self.assertIn("Team A vs Soon", reminders[0].subject)
+
+        # a rerun queues nothing new
+        out = io.StringIO()
+        call_command("send_reminders", "--hours", "24", stdout=out)
+        self.assertIn("Queued 0 reminder(s)", out.getvalue())
+
+        # a slot that changed hands is reminded to its new volunteer
+        slot = self.soon.slots.get(volunteer=self.users[1])
+        slot.volunteer = self.users[2]
+        slot.save()
+        call_command("send_reminders", "--hours", "24", stdout=io.StringIO())
+        self.assertEqual(QueuedEmail.objects.filter(to=["user2@example.com"]).count(), 1)
+
+    def test_send_uses_one_connection_per_batch(self):
+        opened = []
+        original = mail.get_connection
+
+        def counting_connection(*args, **kwargs):
+            connection = original(*args, **kwargs)
+            opened.append(connection)
+            return connection
+
+        with self.settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"):
+            with unittest.mock.patch("core.mail.get_connection", counting_connection):
+                call_command("send_reminders", "--hours", "200", "--send", stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(len(opened), 1)
+        self.assertFalse(QueuedEmail.objects.filter(status="pending").exists())
+
+    def test_dry_run(self):
+        out = io.StringIO()
+        call_command("send_reminders", "--hours", "200", "--dry-run", stdout=out)
+        self.assertIn("Would queue 4 reminder(s)", out.getvalue())
+        self.assertFalse(QueuedEmail.objects.exists())
+
+
+class AssignmentSolverTests(TestCase):
+
+    def setUp(self):
+        self.team_a = HomeTeam.objects.create(name="Team A")
+        self.team_b = HomeTeam.objects.create(name="Team B")
+        self.players = [User.objects.create_user(username=f"player{i}") for i in range(2)]
+        for player in self.players:
+            player.profile.home_team = self.team_a
+            player.profile.save()
+        self.others = [User.objects.create_user(username=f"user{i}") for i in range(4)]
+        self.start = timezone.localdate() + timedelta(days=1)
+        self.matches = [
+            Match.objects.create(date=self.start + timedelta(days=i), start_time=time(18, 0),
+                                 home_team=self.team_a if i % 2 else self.team_b, guest_team="Team A" if i == 2 else "Guests")
+            for i in range(4)
+        ]
+        # user0 is already busy
+        for match in self.matches[:2]:
+            slot = match.slots.order_by("id").first()
+            slot.volunteer = self.others[0]
+            slot.save()
+        self.until = self.start + timedelta(days=3)
+
+    def test_respects_constraints_and_balances(self):
+        call_command("assign_slots", "--from", str(self.start), "--until", str(self.until), stdout=io.StringIO())
+        self.assertFalse(VolunteerSlot.objects.filter(volunteer__isnull=True).exists())
+        for match in self.matches:
+            volunteers = list(match.slots.values_list("volunteer", flat=True))
+            self.assertEqual(len(set(volunteers)), 3)
+            # Team A plays the odd matches at home and the third one away
+            if match.home_team == self.team_a or match.guest_team == "Team A":
+                self.assertFalse(set(volunteers) & {p.pk for p in self.players})
+        loads = [VolunteerSlot.objects.filter(volunteer=user).count() for user in self.players + self.others]
+        # 12 slots over 6 users: only Team B's match is open to everyone
+        self.assertEqual(sum(loads), 12)
+        self.assertLessEqual(max(loads) - min(loads), 2)
+        self.assertEqual(sorted(loads[2:]), [2, 2, 3, 3])
+
+    def test_max_per_user(self):
+        plan = plan_assignments(self.start, self.until, max_per_user=2)
+        self.assertTrue(all(load <= 2 for load in plan.loads_after.values()))
+        self.assertEqual(len(plan.assignments) + len(plan.unfilled), 10)
+        # user0 already has 2, the other three can take 2 each and the players one each in Team B's match
+        self.assertEqual(len(plan.assignments), 8)
+
+    def test_moves_earlier_choices_to_fill_slots(self):
+        # greedy would give slot 1 to user 1, who is the only one allowed in match 2
+        matches = {1: (None, "", [(1, None)]), 2: (7, "", [(2, None)])}
+        users = {1: (None, None), 2: (7, "Team 7")}
+        plan = Solver(matches, users, max_per_user=1).solve()
+        self.assertEqual(plan.assignments, {1: 2, 2: 1})
+        self.assertEqual(plan.unfilled, [])
+
+    def test_dry_run(self):
+        out = io.StringIO()
+        call_command("assign_slots", "--until", str(self.until), "--dry-run", stdout=out)
+        self.assertIn("10 open slot(s)", out.getvalue())
+        self.assertIn("Dry run", out.getvalue())
+        self.assertEqual(VolunteerSlot.objects.filter(volunteer__isnull=False).count(), 2)
+
+    def test_skips_slots_taken_meanwhile(self):
+        plan = plan_assignments(self.start, self.until)
+        slot_id = next(iter(plan.assignments))
+        VolunteerSlot.objects.filter(pk=slot_id).update(volunteer=self.others[3])
+        self.assertEqual(apply_plan(plan), len(plan.assignments) - 1)
+
+    def test_never_overfills_a_match_that_filled_up_meanwhile(self):
+        plan = plan_assignments(self.start, self.until)
+        match = self.matches[0]
+        planned = {plan.assignments[pk] for pk in match.slots.filter(pk__in=plan.assignments).values_list("pk", flat=True)}
+        self.assertEqual(len(planned), 2)
+        # someone else claims a slot the plan doesn't use, which fills the match
+        extra = VolunteerSlot.objects.create(match=match)
+        claimer = next(user for user in self.players + self.others[1:] if user.pk not in planned)
+        claim_slot(claimer, match.id, extra.pk)
+        # only one of the two planned slots still fits
+        self.assertEqual(apply_plan(plan), len(plan.assignments) - 1)
+        match.refresh_from_db()
+        self.assertEqual((match.filled_slots, match.open_slots), (3, 0))
+        self.assertEqual(match.slots.filter(volunteer__isnull=False).count(), 3)
+        self.assertFalse(drifted_counters(Match.objects.all()).exists())
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password=None, email="admin@example.com")
+        self.client.force_login(self.admin)
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.users = []
+
+    def add_data(self, count):
+        # every match gets a new volunteer in its first slot
+        start = Match.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f"user{i}")
+            user.profile.home_team = self.team
+            user.profile.save()
+            self.users.append(user)
+            match = Match.objects.create(date=date.today() + timedelta(days=i), start_time=time(10, 0),
+                                         home_team=self.team, guest_team=f"Guest {i}")
+            slot = match.slots.order_by("id")[0]
+            slot.volunteer = user
+            slot.save()
+
+    def count_queries(self, name):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelists_query_count_is_constant(self):
+        pages = ["admin:core_volunteerslot_changelist", "admin:core_match_changelist", "admin:core_profile_changelist"]
+        self.add_data(2)
+        small = [self.count_queries(name) for name in pages]
+        self.add_data(40)
+        self.assertEqual([self.count_queries(name) for name in pages], small)
+
+    def test_changelist_shows_occupancy_without_listing_users(self):
+        self.add_data(3)
+        response = self.client.get(reverse("admin:core_match_changelist"))
+        self.assertContains(response, "1/3")
+        response = self.client.get(reverse("admin:core_volunteerslot_changelist"))
+        # the volunteer filter is empty/not empty, not a list of every user
+        self.assertNotContains(response, "volunteer__id__exact")
+        self.assertContains(response, "volunteer__isempty")
+
+    def run_action(self, action, slots, username=""):
+        return self.client.post(reverse("admin:core_volunteerslot_changelist"), {
+            "action": action, "_selected_action": [slot.pk for slot in slots], "username": username,
+        }, follow=True)
+
+    def test_assign_volunteer(self):
+        self.add_data(3)
+        slots = [Match.objects.get(guest_team=f"Guest {i}").slots.filter(volunteer__isnull=True).first() for i in range(3)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.run_action("assign_volunteer", slots, "admin")
+        self.assertContains(response, "Assigned 3 slot(s) to admin.")
+        self.assertEqual(VolunteerSlot.objects.filter(volunteer=self.admin).count(), 3)
+        self.assertEqual(len([q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "core_volunteerslot"')]), 1)
+
+    def test_assign_refuses_two_slots_in_a_match(self):
+        self.add_data(1)
+        slots = list(Match.objects.get().slots.filter(volunteer__isnull=True))
+        response = self.run_action("assign_volunteer", slots, "admin")
+        self.assertContains(response, "would hold two slots in the same match.")
+        self.assertFalse(VolunteerSlot.objects.filter(volunteer=self.admin).exists())
+
+        response = self.run_action("assign_volunteer", slots, "nobody")
+        self.assertContains(response, "No user named &#x27;nobody&#x27;.")
+
+    def test_clear_volunteers_cancels_their_offers(self):
+        self.add_data(2)
+        slot = VolunteerSlot.objects.get(volunteer=self.users[0])
+        offer = Offer.objects.create(user=self.users[0], slot=slot, type="trade")
+        response = self.run_action("clear_volunteers", VolunteerSlot.objects.all())
+        self.assertContains(response, "Cleared 2 slot(s).")
+        self.assertFalse(VolunteerSlot.objects.filter(volunteer__isnull=False).exists())
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, "cancelled")
+
+
+class TradeMatchingTests(TestCase):
+
+    def setUp(self):
+        self.teams = [HomeTeam.objects.create(name=f"Team {name}") for name in "ABC"]
+        # the players of each team hold a slot in the next team's home match
+        self.matches = [
+            Match.objects.create(date=date.today() + timedelta(days=1), start_time=time(10 + n, 0),
+                                 home_team=team, guest_team="Guests")
+            for n, team in enumerate(self.teams)
+        ]
+        self.users = []
+        for n, team in enumerate(self.teams):
+            user = User.objects.create_user(username=f"player{n}", email=f"player{n}@example.com")
+            user.profile.home_team = team
+            user.profile.save()
+            slot = self.matches[(n + 1) % 3].slots.order_by("id").first()
+            slot.volunteer = user
+            slot.save()
+            self.users.append(user)
+
+    def offer(self, user):
+        return Offer.objects.create(user=user, slot=user.volunteer_slots.get(), type="trade")
+
+    def test_pair_swaps_slots(self):
+        free = User.objects.create_user(username="free", email="free@example.com")
+        slot = self.matches[2].slots.filter(volunteer__isnull=True).first()
+        slot.volunteer = free
+        slot.save()
+        # player1 (Team B) can't take player0's slot in Team B's match, free can
+        mine, theirs = self.offer(self.users[0]), self.offer(free)
+        self.offer(self.users[1])
+        self.assertEqual(match_trades(), [[mine.pk, theirs.pk]])
+        self.assertEqual(self.users[0].volunteer_slots.get(), slot)
+        self.assertEqual(free.volunteer_slots.get().match, self.matches[1])
+        self.assertEqual(Offer.objects.filter(status="accepted").count(), 2)
+        self.assertEqual(Offer.objects.filter(status="open").get().user, self.users[1])
+        self.assertEqual(QueuedEmail.objects.count(), 2)
+
+    def test_three_way_cycle_respects_home_teams(self):
+        offers = [self.offer(user) for user in self.users]
+        # nobody may take the slot of the one before: only the three-way cycle works
+        self.assertEqual(find_trades(), [[offers[0].pk, offers[1].pk, offers[2].pk]])
+        match_trades()
+        for n, user in enumerate(self.users):
+            match = user.volunteer_slots.get().match
+            self.assertEqual(match, self.matches[(n + 2) % 3])
+            self.assertNotEqual(match.home_team, user.profile.home_team)
+
+    def test_no_swap_into_a_match_you_already_volunteer_in(self):
+        for user in self.users:
+            self.offer(user)
+        # player0 would take player1's slot in Team C's match, but already helps there
+        slot = self.matches[2].slots.filter(volunteer__isnull=True).first()
+        slot.volunteer = self.users[0]
+        slot.save()
+        self.assertEqual(find_trades(), [])
+        self.assertEqual(match_trades(), [])
+        self.assertFalse(Offer.objects.exclude(status="open").exists())
+
+    def test_stale_offer_is_skipped(self):
+        offers = [self.offer(user) for user in self.users]
+        trades = find_trades()
+        VolunteerSlot.objects.filter(pk=offers[1].slot_id).update(volunteer=None)
+        self.assertFalse(execute_trade(trades[0]))
+        self.assertEqual(self.users[0].volunteer_slots.get().match, self.matches[1])
+        self.assertEqual(Offer.objects.filter(status="open").count(), 3)
+
+    def test_new_offer_is_matched_right_away(self):
+        self.offer(self.users[0])
+        self.offer(self.users[1])
+        self.client.force_login(self.users[2])
+        response = self.client.post(reverse("offer_create"), {
+            "type": "trade", "slot": self.users[2].volunteer_slots.get().pk, "details": "",
+        }, follow=True)
+        self.assertContains(response, "matched right away")
+        self.assertEqual(self.users[2].volunteer_slots.get().match, self.matches[1])
+
+    def test_large_graph(self):
+        # 3000 offers by 3000 users over 300 matches, every user blocked from 10 of them;
+        # the benchmark command times the same graph (trade_graph)
+        offers = [(n, n, n % 300) for n in range(3000)]
+        blocked = {n: {(n + k * 31) % 300 for k in range(10)} | {n % 300} for n in range(3000)}
+        cycles = TradeGraph(offers, blocked).cycles()
+        self.assertEqual(sum(len(cycle) for cycle in cycles), 3000)
+
+
+class RosterExportTests(TestCase):
+
+    def setUp(self):
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.staff = User.objects.create_user(username="official", is_staff=True)
+        self.user = User.objects.create_user(username="user1", first_name="Anna", last_name="Muster",
+                                             email="anna@example.com")
+        self.user.profile.phone_number = "+41 79 000 00 00"
+        self.user.profile.save()
+        for day in range(3):
+            match = Match.objects.create(date=date(2026, 3, 1) + timedelta(days=day), start_time=time(18, 0),
+                                         home_team=self.team, guest_team=f"Guest {day}", location="Hall, 1")
+            slot = match.slots.order_by("id").first()
+            slot.volunteer = self.user
+            slot.save()
+
+    def test_streams_the_roster_in_one_query(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("roster_export"), {"from": "2026-03-02"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        with CaptureQueriesContext(connection) as ctx:
+            rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(rows[0][:2], ["date", "start_time"])
+        # two matches of three slots, one taken in each
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[1], ["2026-03-02", "18:00:00", "Team A", "Guest 1", "Hall, 1", "user1", "Anna",
+                                   "Muster", "anna@example.com", "'+41 79 000 00 00"])
+        self.assertEqual(rows[2][5:], ["", "", "", "", ""])
+
+    def test_formulas_are_quoted(self):
+        self.user.username = "=HYPERLINK(\"http://evil\")"
+        self.user.first_name = "@SUM(A1)"
+        self.user.last_name = "-2+3"
+        self.user.save()
+        self.team.name = "+Team"
+        self.team.save()
+        row = list(csv.reader(roster_csv(roster_slots(date(2026, 3, 1), date(2026, 3, 1)))))[1]
+        self.assertEqual(row[2], "'+Team")
+        self.assertEqual(row[5:8], ["'=HYPERLINK(\"http://evil\")", "'@SUM(A1)", "'-2+3"])
+        # dates and ordinary text are left alone
+        self.assertEqual(row[:2], ["2026-03-01", "18:00:00"])
+        self.assertEqual(row[8], "anna@example.com")
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("roster_export"))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse("roster_export"), {"until": "March"}).status_code, 400)
+
+    async def test_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse("roster_export"), {"team": "Team A"})
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(len(body.splitlines()), 10)
+        self.assertIn("anna@example.com", body)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command("export_roster", "--until", "2026-03-01", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+        with tempfile.TemporaryDirectory() as tmp:
+            out = io.StringIO()
+            call_command("export_roster", "--output", f"{tmp}/roster.csv", stdout=out)
+            self.assertIn("Wrote 9 slot(s)", out.getvalue())
+            with open(f"{tmp}/roster.csv", newline="", encoding="utf-8") as f:
+                self.assertEqual(sum(1 for row in csv.reader(f)), 10)
+
+
+class MatchCounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.users = [User.objects.create_user(username=f"user{i}") for i in range(4)]
+        self.match = Match.objects.create(date=date.today() + timedelta(days=1), start_time=time(10, 0),
+                                          home_team=self.team, guest_team="Guest")
+
+    def assertCounters(self, filled, open_slots, match=None):
+        match = Match.objects.get(pk=(match or self.match).pk)
+        self.assertEqual((match.filled_slots, match.open_slots), (filled, open_slots))
+
+    def test_new_match_gets_its_capacity_in_slots(self):
+        match = Match.objects.create(date=date.today(), start_time=time(12, 0), home_team=self.team,
+                                     guest_team="Other", capacity=5)
+        self.assertEqual(match.slots.count(), 5)
+        self.assertCounters(0, 5, match)
+        self.assertCounters(0, 3)
+
+    def test_claims_and_reassignments_keep_counters(self):
+        claim_slot(self.users[0], self.match.id)
+        claim_slot(self.users[1], self.match.id)
+        self.assertCounters(2, 1)
+        slot_ids = list(self.match.slots.filter(volunteer__isnull=False).values_list("pk", flat=True))
+        reassign_slots(slot_ids[:1])
+        self.assertCounters(1, 2)
+        reassign_slots(self.match.slots.filter(volunteer__isnull=True).values_list("pk", flat=True)[:1], self.users[2])
+        self.assertCounters(2, 1)
+        with self.assertRaises(SlotUnavailable):
+            reassign_slots(slot_ids[1:], self.users[2])
+        self.assertCounters(2, 1)
+
+    def test_full_match_rejects_claims_without_touching_counters(self):
+        for user in self.users[:3]:
+            claim_slot(user, self.match.id)
+        with self.assertRaisesMessage(SlotUnavailable, "already has 3 volunteers"):
+            claim_slot(self.users[3], self.match.id)
+        self.assertCounters(3, 0)
+        with self.assertRaisesMessage(SlotUnavailable, "already volunteering"):
+            claim_slot(self.users[0], self.match.id)
+        self.assertCounters(3, 0)
+
+    def test_saving_and_deleting_recounts(self):
+        slot = self.match.slots.order_by("id")[0]
+        slot.volunteer = self.users[0]
+        slot.save()
+        self.assertCounters(1, 2)
+        self.users[0].delete()
+        self.assertCounters(0, 3)
+        claim_slot(self.users[1], self.match.id)
+        self.match.slots.filter(volunteer__isnull=False).delete()
+        # open_slots counts against the capacity, not the slot rows
+        self.assertCounters(0, 3)
+
+    def test_raising_capacity_adds_slots(self):
+        claim_slot(self.users[0], self.match.id)
+        self.match.capacity = 5
+        self.match.save()
+        self.assertEqual(self.match.slots.count(), 5)
+        self.assertCounters(1, 4)
+        self.match.capacity = 1
+        self.match.save()
+        # taken slots are kept, the match is just full
+        self.assertCounters(1, 0)
+        with self.assertRaises(SlotUnavailable):
+            claim_slot(self.users[1], self.match.id)
+
+    def test_board_filters_and_sorts_by_open_slots(self):
+        full = Match.objects.create(date=date.today(), start_time=time(10, 0), home_team=self.team,
+                                    guest_team="Full", capacity=1)
+        half = Match.objects.create(date=date.today(), start_time=time(12, 0), home_team=self.team,
+                                    guest_team="Half", capacity=4)
+        claim_slot(self.users[0], full.id)
+        claim_slot(self.users[0], half.id)
+        claim_slot(self.users[1], half.id)
+        self.client.force_login(self.users[3])
+
+        response = self.client.get(reverse("match_list"))
+        self.assertEqual([item["match"].id for item in response.context["match_data"]],
+                         [full.id, half.id, self.match.id])
+        self.assertContains(response, "(1/1)")
+        response = self.client.get(reverse("match_list"), {"open": "on"})
+        self.assertEqual([item["match"].id for item in response.context["match_data"]], [half.id, self.match.id])
+        response = self.client.get(reverse("match_list"), {"sort": "open"})
+        self.assertEqual([item["match"].id for item in response.context["match_data"]],
+                         [self.match.id, half.id, full.id])
+
+        # the filtered listing follows claims
+        claim_slot(self.users[2], half.id)
+        claim_slot(self.users[3], half.id)
+        response = self.client.get(reverse("match_list"), {"open": "on"})
+        self.assertEqual([item["match"].id for item in response.context["match_data"]], [self.match.id])
+
+    def test_repair_command_fixes_drift(self):
+        claim_slot(self.users[0], self.match.id)
+        other = Match.objects.create(date=date.today(), start_time=time(12, 0), home_team=self.team, guest_team="Other")
+        # writes that bypass the services and signals
+        Match.objects.filter(pk=self.match.pk).update(filled_slots=3, open_slots=0)
+        VolunteerSlot.objects.filter(pk=other.slots.order_by("id")[0].pk).update(volunteer=self.users[1])
+        self.assertEqual(set(drifted_counters(Match.objects.all()).values_list("pk", flat=True)),
+                         {self.match.pk, other.pk})
+
+        out = io.StringIO()
+        call_command("repair_match_counters", "--dry-run", stdout=out)
+        self.assertIn("2 match(es)", out.getvalue())
+        self.assertCounters(3, 0)
+
+        call_command("repair_match_counters", "--batch-size", "1", stdout=io.StringIO())
+        self.assertCounters(1, 2)
+        self.assertCounters(1, 2, other)
+        self.assertFalse(drifted_counters(Match.objects.all()).exists())
+
+
+class MyScheduleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = HomeTeam.objects.create(name="Team A")
+        self.user = User.objects.create_user(username="user1")
+        self.other = User.objects.create_user(username="user2")
+        self.matches = [
+            Match.objects.create(date=date.today() + timedelta(days=i), start_time=time(10, 0),
+                                 home_team=self.team, guest_team=f"Guest {i}")
+            for i in range(-1, 4)
+        ]
+        self.client.force_login(self.user)
+
+    def schedule(self):
+        response = self.client.get(reverse("my_schedule"))
+        self.assertEqual(response.status_code, 200)
+        return [(slot["match_id"], [offer["type"] for offer in slot["offers"]]) for slot in response.context["slots"]]
+
+    def test_upcoming_slots_with_open_offers(self):
+        past, first, second, third, fourth = self.matches
+        slot_ids = {match.pk: claim_slot(self.user, match.pk) for match in (fourth, past, first, second)}
+        claim_slot(self.other, third.pk)
+        Offer.objects.create(user=self.user, slot_id=slot_ids[first.pk], type="trade")
+        Offer.objects.create(user=self.user, slot_id=slot_ids[first.pk], type="time")
+        Offer.objects.create(user=self.user, slot_id=slot_ids[second.pk], type="trade", status="cancelled")
+
+        self.assertEqual(self.schedule(), [(first.pk, ["trade", "time"]), (second.pk, []), (fourth.pk, [])])
+        response = self.client.get(reverse("my_schedule"))
+        self.assertContains(response, "Trade requested")
+        self.assertContains(response, f"?slot={slot_ids[second.pk]}&type=trade")
+
+        data = self.client.get(reverse("api_my_assignments")).json()
+        self.assertEqual([row["match_id"] for row in data["assignments"]], [first.pk, second.pk, fourth.pk])
+        self.assertEqual([offer["type"] for offer in data["assignments"][0]["offers"]], ["trade", "time"])
+
+    def schedule_tables(self):
+        with CaptureQueriesContext(connection) as ctx:
+            slots = self.schedule()
+        return slots, {q["sql"].split(" FROM ")[1].split()[0].strip('"') for q in ctx.captured_queries}
+
+    def test_cached_until_the_users_slots_change(self):
+        match = self.matches[1]
+        claim_slot(self.user, match.pk)
+        self.assertEqual(self.schedule_tables(), ([(match.pk, [])], {"django_session", "auth_user", "core_volunteerslot"}))
+        # a warm schedule only costs the authentication, even after other users' claims
+        self.assertEqual(self.schedule_tables(), ([(match.pk, [])], {"django_session", "auth_user"}))
+        claim_slot(self.other, match.pk)
+        self.assertEqual(self.schedule_tables(), ([(match.pk, [])], {"django_session", "auth_user"}))
+
+        claim_slot(self.user, self.matches[2].pk)
+        self.assertEqual(self.schedule(), [(match.pk, []), (self.matches[2].pk, [])])
+
+    def test_follows_offers_trades_and_edits(self):
+        match = self.matches[1]
+        slot_id = claim_slot(self.user, match.pk)
+        self.schedule()
+        offer = Offer.objects.create(user=self.user, slot_id=slot_id, type="trade")
+        self.assertEqual(self.schedule(), [(match.pk, ["trade"])])
+
+        # the other user takes the slot: it leaves this schedule
+        accept_offer(self.other, offer.pk)
+        self.assertEqual(self.schedule(), [])
+
+        # a slot saved by hand (the admin) changes both schedules
+        self.client.force_login(self.other)
+        self.assertEqual(self.schedule(), [(match.pk, [])])
+        slot = VolunteerSlot.objects.get(pk=slot_id)
+        slot.volunteer = self.user
+        slot.save()
+        self.assertEqual(self.schedule(), [])
+        self.client.force_login(self.user)
+        self.assertEqual(self.schedule(), [(match.pk, [])])
+
+        match.guest_team = "Renamed"
+        match.save()
+        response = self.client.get(reverse("my_schedule"))
+        self.assertContains(response, "Renamed")
+
+        reassign_slots([slot_id])
+        self.assertEqual(self.schedule(), [])
@@ -0,0 +1,272 @@
+"""
+Automatic swaps between open trade offers.
+
+A trade offer says "I hold this slot and would rather have another one".
+Offer i can take the slot of offer j when its user doesn't play in j's
+match and holds no slot in it yet (the rules of signup and accept_offer).
+Those are the edges of a directed graph over the open offers; every cycle
+in it is a swap where each user takes the next one's slot, so nobody ends
+up with more or fewer slots than before.
+
+The graph is dense (nearly everyone may take nearly any slot), so it is
+never built edge by edge. Each offer gets bitsets, Python ints with one
+bit per offer in creation order: the offers whose slot it may take and
+the offers that may take its slot. Finding a swap partner is an AND of
+two ints, which keeps thousands of offers well under a second.
+
+Pairs are matched first, oldest offers first, then cycles of up to
+MAX_PARTIES offers among the rest. Longer cycles are rare and every party
+is one more chance for the swap to fail.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, When
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .cache import invalidate
+from .events import slot_event
+from .mail import queue_email
+from .models import Offer, Profile, VolunteerSlot
+from .utils import volunteering_window
+
+MAX_PARTIES = 4
+
+
+def _bits(mask):
+    """Indexes of the set bits, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _lowest(mask):
+    return (mask & -mask).bit_length() - 1
+
+
+class TradeGraph:
+    """
+    ``offers`` is a list of (offer id, user id, match id) in creation order,
+    ``blocked`` maps user id -> the match ids they can't get a slot in.
+    """
+
+    def __init__(self, offers, blocked):
+        self.offers = offers
+        everyone = (1 << len(offers)) - 1
+        by_match, by_user = {}, {}
+        for n, (offer_id, user_id, match_id) in enumerate(offers):
+            by_match[match_id] = by_match.get(match_id, 0) | 1 << n
+            by_user[user_id] = by_user.get(user_id, 0) | 1 << n
+
+        # offers whose user may not take a slot of the match
+        blocked_in = {}
+        for user_id, user_bits in by_user.items():
+            for match_id in blocked.get(user_id, ()):
+                blocked_in[match_id] = blocked_in.get(match_id, 0) | user_bits
+
+        self.takes = []  # n -> offers whose slot n's user may take
+        self.taken_by = []  # n -> offers whose user may take n's slot
+        out_by_user = {}
+        for offer_id, user_id, match_id in offers:
+            if user_id not in out_by_user:
+                out = everyone & ~by_user[user_id]
+                for blocked_match in blocked.get(user_id, ()):
+                    out &= ~by_match.get(blocked_match, 0)
+                out_by_user[user_id] = out
+            self.takes.append(out_by_user[user_id])
+            self.taken_by.append(everyone & ~by_user[user_id] & ~blocked_in.get(match_id, 0))
+
+    def cycles(self):
+        """
+        Disjoint cycles as lists of offer indexes, each taking the slot of the
+        next one and the last the slot of the first.
+        """
+        alive = (1 << len(self.offers)) - 1
+        found = []
+        for n in range(len(self.offers)):
+            if not alive >> n & 1:
+                continue
+            partners = self.takes[n] & self.taken_by[n] & alive
+            if partners:
+                other = _lowest(partners)
+                found.append([n, other])
+                alive &= ~(1 << n | 1 << other)
+
+        for size in range(3, MAX_PARTIES + 1):
+            # a cycle stays within a strongly connected component
+            components = self._components(alive)
+            for n in range(len(self.offers)):
+                if alive >> n & 1 and components[n] & ~(1 << n):
+                    cycle = self._cycle_from(n, size, alive & components[n])
+                    if cycle:
+                        found.append(cycle)
+                        for member in cycle:
+                            alive &= ~(1 << member)
+        return found
+
+    def _components(self, alive):
+        """Strongly connected components among ``alive`` (Kosaraju), as n -> its component's bitset."""
+        order = []
+        unvisited = alive
+        for root in _bits(alive):
+            if not unvisited >> root & 1:
+                continue
+            unvisited &= ~(1 << root)
+            stack = [root]
+            while stack:
+                successors = self.takes[stack[-1]] & unvisited
+                if successors:
+                    n = _lowest(successors)
+                    unvisited &= ~(1 << n)
+                    stack.append(n)
+                else:
+                    order.append(stack.pop())
+
+        components = {}
+        unvisited = alive
+        for root in reversed(order):
+            if not unvisited >> root & 1:
+                continue
+            unvisited &= ~(1 << root)
+            component = 1 << root
+            stack = [root]
+            while stack:
+                predecessors = self.taken_by[stack.pop()] & unvisited
+                unvisited &= ~predecessors
+                component |= predecessors
+                stack.extend(_bits(predecessors))
+            for n in _bits(component):
+                components[n] = component
+        return components
+
+    def _cycle_from(self, start, size, alive):
+        available = alive & ~(1 << start)
+        # reach[d]: offers that can pass start's slot back in d more steps, so
+        # the search below doesn't walk into dead ends on a dense graph. The
+        # first step goes unfiltered, its layer would cost more than it saves.
+        reach = [self.taken_by[start] & available]
+        for _ in range(size - 3):
+            layer = 0
+            for n in _bits(reach[-1]):
+                layer |= self.taken_by[n]
+            reach.append(layer & available)
+
+        def extend(path, available):
+            left = size - len(path)
+            candidates = self.takes[path[-1]] & available
+            if left - 1 < len(reach):
+                candidates &= reach[left - 1]
+            if left == 1:
+                return path + [_lowest(candidates)] if candidates else None
+            for nxt in _bits(candidates):
+                cycle = extend(path + [nxt], available & ~(1 << nxt))
+                if cycle:
+                    return cycle
+            return None
+
+        return extend([start], available)
+
+
+def load_graph():
+    """The open trade offers of upcoming matches as a TradeGraph, in three queries."""
+    rows = {}
+    for offer_id, user_id, slot_id, match_id, home_id, guest in (
+        Offer.objects.filter(
+            type="trade", status="open",
+            slot__volunteer=F("user"),  # offers on a slot that changed hands can't be traded
+            slot__match__date__gte=timezone.localdate(),
+        )
+        .order_by("created_at", "id")
+        .values_list("id", "user_id", "slot_id", "slot__match_id", "slot__match__home_team_id", "slot__match__guest_team")
+    ):
+        # the oldest offer of a slot, should it have been offered twice
+        rows.setdefault(slot_id, (offer_id, user_id, match_id, home_id, guest))
+    user_ids = {user_id for offer_id, user_id, *rest in rows.values()}
+    matches = {match_id: (home_id, guest) for offer_id, user_id, match_id, home_id, guest in rows.values()}
+
+    blocked = {user_id: set() for user_id in user_ids}
+    for user_id, match_id in VolunteerSlot.objects.filter(
+        volunteer_id__in=user_ids, match_id__in=matches
+    ).values_list("volunteer_id", "match_id"):
+        blocked[user_id].add(match_id)
+    played = {}  # team -> matches it plays in
+    for user_id, team_id, team_name in Profile.objects.filter(
+        user_id__in=user_ids, home_team__isnull=False
+    ).values_list("user_id", "home_team_id", "home_team__name"):
+        if team_id not in played:
+            played[team_id] = {
+                match_id for match_id, (home_id, guest) in matches.items() if home_id == team_id or guest == team_name
+            }
+        blocked[user_id] |= played[team_id]
+
+    return TradeGraph([(offer_id, user_id, match_id) for offer_id, user_id, match_id, *rest in rows.values()], blocked)
+
+
+def find_trades():
+    """Swaps among the open trade offers, as lists of offer ids (each takes the next one's slot)."""
+    graph = load_graph()
+    return [[graph.offers[n][0] for n in cycle] for cycle in graph.cycles()]
+
+
+def execute_trade(offer_ids):
+    """
+    Carry out one swap from find_trades() in a single transaction. Returns
+    False, changing nothing, when an offer or slot changed since.
+    """
+    with transaction.atomic():
+        offers = {
+            offer.pk: offer
+            for offer in Offer.objects.select_for_update(of=("self",))
+            .select_related("user", "slot__match__home_team")
+            .filter(pk__in=offer_ids, type="trade", status="open")
+            .order_by("pk")
+        }
+        if len(offers) != len(offer_ids):
+            return False
+        slot_ids = [offers[pk].slot_id for pk in offer_ids]
+        holders = dict(VolunteerSlot.objects.select_for_update().filter(pk__in=slot_ids)
+                       .order_by("pk").values_list("id", "volunteer_id"))
+        if any(holders.get(offer.slot_id) != offer.user_id for offer in offers.values()):
+            return False
+
+        # everyone takes the slot of the next offer, the last one the first's
+        cycle = [offers[pk] for pk in offer_ids]
+        new_holders = {cycle[(n + 1) % len(cycle)].slot_id: offer.user_id for n, offer in enumerate(cycle)}
+        try:
+            with transaction.atomic():
+                VolunteerSlot.objects.filter(pk__in=slot_ids).update(
+                    volunteer=Case(*(When(pk=slot_id, then=user_id) for slot_id, user_id in new_holders.items()))
+                )
+        except IntegrityError:
+            # someone joined one of the matches meanwhile
+            return False
+
+        Offer.objects.filter(pk__in=offer_ids).update(status="accepted")
+        Offer.objects.filter(slot_id__in=slot_ids, status="open").update(status="cancelled")
+        invalidate(
+            "calendar", "offers",
+            *{f"match:{offer.slot.match_id}" for offer in cycle},
+            *(f"volunteer:{offer.user_id}" for offer in cycle),
+        )
+        for n, offer in enumerate(cycle):
+            new_slot = cycle[(n + 1) % len(cycle)].slot
+            slot_event(new_slot.pk, new_slot.match_id, offer.user_id)
+            if offer.user.email:
+                queue_email(
+                    f"🔁 Trade done: Volunteering for {new_slot.match}",
+                    render_to_string("volunteers/email_trade.txt", {
+                        "user": offer.user,
+                        "old_slot": offer.slot,
+                        "slot": new_slot,
+                        "arrival_time": volunteering_window(new_slot.match)[0],
+                    }),
+                    to=[offer.user.email],
+                    cc=[settings.VOLUNTEERING_ADMIN_EMAIL],
+                )
+    return True
+
+
+def match_trades():
+    """Find and carry out every swap among the open trade offers; returns the swaps done."""
+    return [offer_ids for offer_ids in find_trades() if execute_trade(offer_ids)]
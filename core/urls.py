@@ -1,13 +1,23 @@
 # core/urls.py
 from django.urls import path
-from . import views
+from . import api, views
 from .views import OfferListView, OfferCreateView
 
 urlpatterns = [
     path("", views.match_list, name="match_list"),
+    path("my-schedule/", views.my_schedule, name="my_schedule"),
     path("signup-slot/<int:match_id>/<int:slot_id>/", views.signup_slot, name="signup_slot"),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path("trading/", OfferListView.as_view(), name="offer_list"),
     path("trading/new/", OfferCreateView.as_view(), name="offer_create"),
     path("trading/accept/<int:offer_id>/", views.accept_offer, name="accept_offer"),
+    path("calendar/user/<str:token>.ics", views.user_calendar, name="user_calendar"),
+    path("calendar/team/<int:team_id>.ics", views.team_calendar, name="team_calendar"),
+    path("events/", views.live_events, name="live_events"),
+    path("metrics/requests/", views.request_metrics, name="request_metrics"),
+    path("metrics/cache/", views.cache_metrics, name="cache_metrics"),
+    path("export/roster.csv", views.roster_export, name="roster_export"),
+    path("api/matches/", api.matches, name="api_matches"),
+    path("api/offers/", api.offers, name="api_offers"),
+    path("api/me/assignments/", api.my_assignments, name="api_my_assignments"),
 ]
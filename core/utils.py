@@ -1,28 +1,90 @@
 from icalendar import Calendar, Event
 from datetime import datetime, timedelta
+from itertools import groupby
 from django.utils import timezone
 
-def create_ics_for_slot(slot):
-    match = slot.match
 
+def volunteering_window(match):
+    """Volunteers meet 90 minutes before kick-off and help for two hours."""
     # Combine match date + start_time into a full datetime
     start_dt = datetime.combine(match.date, match.start_time)
     start_dt = timezone.make_aware(start_dt, timezone.get_current_timezone())
 
     start_dt = start_dt - timedelta(minutes=90)
     end_dt = start_dt + timedelta(hours=2)
+    return start_dt, end_dt
 
+
+def new_calendar(name=None):
     cal = Calendar()
     cal.add('prodid', '-//Volunteering App//example.com//')
     cal.add('version', '2.0')
+    if name:
+        cal.add('x-wr-calname', name)
+    return cal
+
+
+def event_for_slot(slot, stamp=None):
+    match = slot.match
+    start_dt, end_dt = volunteering_window(match)
 
     event = Event()
+    # stable per slot, so calendar clients update the event instead of duplicating it
+    event.add('uid', f"slot-{slot.id}@volunteer-app")
     event.add('summary', f"Volunteering for {match.home_team} vs {match.guest_team}")
     event.add('dtstart', start_dt)
     event.add('dtend', end_dt)
-    event.add('dtstamp', timezone.now())
+    event.add('dtstamp', stamp or timezone.now())
     event.add('location', match.location or "")
     event.add('description', f"You’re volunteering for the match {match}.")
+    return event
+
+
+def event_for_match(match):
+    """A match as seen by its team: the volunteering window and who is helping."""
+    start_dt, end_dt = volunteering_window(match)
+    volunteers = [slot.volunteer.username for slot in match.slots.all() if slot.volunteer]
+
+    event = Event()
+    event.add('uid', f"match-{match.id}@volunteer-app")
+    event.add('summary', f"{match.home_team} vs {match.guest_team}")
+    event.add('dtstart', start_dt)
+    event.add('dtend', end_dt)
+    event.add('dtstamp', timezone.now())
+    event.add('location', match.location or "")
+    event.add('description', "Volunteers: " + (", ".join(volunteers) or "none yet"))
+    return event
+
+
+def create_ics_for_slot(slot):
+    return calendar_for_slots([slot])
+
+
+def calendar_for_slots(slots, name=None, stamp=None):
+    """One calendar holding every slot; the slots need their match and home team loaded."""
+    cal = new_calendar(name)
+    for slot in slots:
+        cal.add_component(event_for_slot(slot, stamp))
+    return cal.to_ical()
+
+
+def _batch(slots):
+    # one joined query for every match and team, read in chunks so a whole
+    # season never sits in memory at once
+    return slots.filter(volunteer__isnull=False).select_related("match__home_team", "volunteer")
+
+
+def calendars_by_user(slots, name="My volunteering", chunk_size=2000):
+    """Yield ``(volunteer, their slots, ics)`` with one calendar per volunteer."""
+    stamp = timezone.now()
+    slots = _batch(slots).order_by("volunteer_id", "match__date", "match__start_time", "id")
+    for volunteer, group in groupby(slots.iterator(chunk_size=chunk_size), key=lambda slot: slot.volunteer):
+        group = list(group)
+        yield volunteer, group, calendar_for_slots(group, name, stamp)
+
 
-    cal.add_component(event)
-    return cal.to_ical()
\ No newline at end of file
+def iter_slot_ics(slots, chunk_size=2000):
+    """Yield ``(slot, ics)`` with a single-event calendar per slot."""
+    stamp = timezone.now()
+    for slot in _batch(slots).order_by("id").iterator(chunk_size=chunk_size):
+        yield slot, calendar_for_slots([slot], stamp=stamp)
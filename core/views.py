@@ -1,17 +1,46 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.generic import ListView, CreateView
-from django.urls import reverse_lazy
-from django.core.mail import EmailMessage
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from .utils import create_ics_for_slot
+from .mail import queue_email
+from .instrumentation import stats
+from . import events
+from .cache import cache_stats
+from .feeds import team_feed, user_feed, user_feed_token, user_id_from_token
+from . import services
+from .services import OfferUnavailable, SlotUnavailable, claim_slot
+from .board import match_cards, page_match_ids, team_names, you_marker
+from .pagination import akeyset_page
+from .roster import aroster_csv, roster_csv, roster_slots
+from .schedule import user_schedule
+from .trades import match_trades
 from .forms import CustomSignupForm, ProfileForm, UserForm, OfferForm
 from .models import Match, VolunteerSlot, Profile, Offer
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+MATCHES_PER_PAGE = 20
+
+
+async def _auser(request):
+    # resolved once up front: templates and messages read request.user, and the
+    # lazy version would query the database from the event loop
+    request.user = await request.auser()
+    return request.user
+
 
 def signup(request):
     if request.method == "POST":
@@ -26,18 +55,23 @@ def signup(request):
 
 @login_required
 def profile(request):
-    return render(request, "core/profile.html", {"user": request.user})
+    calendar_url = request.build_absolute_uri(
+        reverse("user_calendar", args=[user_feed_token(request.user)])
+    )
+    return render(request, "core/profile.html", {"user": request.user, "calendar_url": calendar_url})
 
 @login_required
 def edit_profile(request):
     user = request.user
-    profile, _ = Profile.objects.get_or_create(user=user)
+    profile = Profile.for_user(user)
 
     if request.method == 'POST':
         user_form = UserForm(request.POST, instance=user)
         profile_form = ProfileForm(request.POST, instance=profile)
         if user_form.is_valid() and profile_form.is_valid():
-            user_form.save()
+            # untouched forms are not written back
+            if user_form.has_changed():
+                user_form.save()
             profile_form.save()
             return redirect('profile')
     else:
@@ -50,38 +84,82 @@ def edit_profile(request):
     })
 
 @login_required
-def match_list(request):
-    # ensure the user has a profile
-    profile, _ = Profile.objects.get_or_create(user=request.user)
-    user_team = profile.home_team
+async def match_list(request):
+    user = await _auser(request)
+    user_team_id = await Profile.objects.filter(user=user).values_list("home_team_id", flat=True).afirst()
 
     # --- filtering logic ---
     selected_team = request.GET.get("team")
     only_my_matches = request.GET.get("my_matches") == "on"
-    matches = (
-        Match.objects.all()
-        .prefetch_related("slots", "home_team")
-        .order_by("date")  # upcoming matches first
-    )
+    show_archive = request.GET.get("archive") == "on"
+    only_open = request.GET.get("open") == "on"
+    most_open_first = request.GET.get("sort") == "open"
+
+    # upcoming matches by default (soonest first), past ones only in the archive (latest first)
+    today = timezone.localdate()
+    if show_archive:
+        matches = Match.objects.filter(date__lt=today)
+        ordering = ("-date", "-start_time", "-id")
+    else:
+        matches = Match.objects.filter(date__gte=today)
+        ordering = ("date", "start_time", "id")
     if selected_team:
         matches = matches.filter(home_team__name=selected_team)
+    # both read the counters on Match (match_open_schedule_idx, match_urgency_idx)
+    if only_open:
+        matches = matches.filter(open_slots__gt=0)
+    if most_open_first:
+        ordering = ("-open_slots",) + ordering
+
+    # the only per-user data: which slots the user holds
+    user_slots = {
+        match_id: slot_id
+        async for match_id, slot_id in VolunteerSlot.objects.filter(volunteer=user).values_list("match_id", "id")
+    }
+
+    cursor = request.GET.get("after")
     if only_my_matches:
-        matches = matches.filter(slots__volunteer=request.user).distinct()
+        listing = None
+        matches = matches.filter(pk__in=list(user_slots))
+    else:
+        # the same for every visitor, so the page itself is cached too
+        listing = f"{today}:{show_archive}:{selected_team or ''}:{only_open}:{most_open_first}"
+    versions = ("schedule",)
+    # a team filter matches by name, which a rename or delete changes
+    if selected_team:
+        versions += ("teams",)
+    # listings by open slots change with every signup, not just with the schedule
+    if only_open or most_open_first:
+        versions += ("calendar",)
 
-    # collect all home teams for dropdown
-    teams = Match.objects.values_list("home_team__name", flat=True).distinct()
+    # the shared, cached part of the board (core.board), in one trip to a worker thread
+    def load_board():
+        match_ids, next_cursor = page_match_ids(
+            matches, ordering, cursor, MATCHES_PER_PAGE, cache_key=listing, versions=versions
+        )
+        return match_cards(match_ids), next_cursor, team_names()
+
+    cards, next_cursor, teams = await sync_to_async(load_board)()
+
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params["after"] = next_cursor
+        next_query = params.urlencode()
 
+    # cached shared cards + the user's own overlay
+    marker = you_marker(user.pk)
     match_data = []
-    for match in matches:
-        can_volunteer = not (user_team and match.home_team == user_team)
-        user_signed_up = match.slots.filter(volunteer=request.user).exists()
-        open_slot = match.slots.filter(volunteer__isnull=True).first()
+    for card in cards:
+        can_volunteer = not (user_team_id and card.home_team_id == user_team_id)
 
         match_data.append({
-            "match": match,
+            "match": card,
+            "card_html": mark_safe(card.html.replace(marker, " (you)")),
             "can_volunteer": can_volunteer,
-            "user_signed_up": user_signed_up,
-            "open_slot": open_slot,
+            "user_signed_up": card.id in user_slots,
+            "user_slot_id": user_slots.get(card.id),
+            "open_slot_id": card.open_slot_id,
         })
 
     return render(
@@ -92,66 +170,97 @@ def match_list(request):
             "teams": teams,
             "selected_team": selected_team,
             "only_my_matches": only_my_matches,
+            "show_archive": show_archive,
+            "only_open": only_open,
+            "most_open_first": most_open_first,
+            "next_query": next_query,
+            "is_first_page": "after" not in request.GET,
         },
     )
 
 @login_required
-def signup_slot(request, match_id, slot_id):
-    slot = get_object_or_404(VolunteerSlot, id=slot_id, match_id=match_id)
-
-    if slot.volunteer is not None:
-        messages.error(request, "This slot is already taken.")
-    elif slot.match.volunteer_count >= 3:
-        messages.error(request, "This match already has 3 volunteers.")
-    elif slot.match.slots.filter(volunteer=request.user).exists():
-        messages.error(request, "You are already volunteering for this match.")
+async def my_schedule(request):
+    user = await _auser(request)
+    # cached per user, see core.schedule; no match or board data is touched
+    slots = await sync_to_async(user_schedule)(user.pk, timezone.localdate())
+    return render(request, "core/my_schedule.html", {"slots": slots})
+
+@login_required
+async def signup_slot(request, match_id, slot_id):
+    user = await _auser(request)
+    try:
+        slot = await VolunteerSlot.objects.select_related("match__home_team").aget(id=slot_id, match_id=match_id)
+    except VolunteerSlot.DoesNotExist:
+        raise Http404("No such slot.")
+
+    try:
+        await sync_to_async(_claim_and_confirm)(user, slot)
+    except SlotUnavailable as exc:
+        messages.error(request, str(exc))
     else:
-        # --- assign the volunteer ---
-        slot.volunteer = request.user
-        slot.save()
+        messages.success(request, "You successfully signed up, thanks a lot! A confirmation email is on its way.")
+
+    return redirect("match_list")
+
+def _claim_and_confirm(user, slot):
+    # --- claim the slot and queue the confirmation together ---
+    with transaction.atomic():
+        claim_slot(user, slot.match_id, slot.id)
+        slot.volunteer = user
 
-        # --- send confirmation email ---
         start_dt = datetime.combine(slot.match.date, slot.match.start_time)
         start_dt = timezone.make_aware(start_dt, timezone.get_current_timezone())
 
         subject = f"✅ Confirmation: Volunteering for {slot.match}"
         message = render_to_string('volunteers/email_confirmation.txt',
             {
-                'user': request.user,
+                'user': user,
                 'slot': slot,
                 "arrival_time": start_dt - timedelta(minutes=90),
             }
         )
-
-        email = EmailMessage(
+        # delivered by the send_queued_mail worker, not on this request
+        queue_email(
             subject,
             message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[request.user.email],
+            to=[user.email],
             cc=[settings.VOLUNTEERING_ADMIN_EMAIL],
+            attachments=[(f"volunteering-{slot.id}.ics", create_ics_for_slot(slot), 'text/calendar')],
         )
 
-        ics_content = create_ics_for_slot(slot)
-        email.attach(f"volunteering-{slot.id}.ics", ics_content, 'text/calendar')
-        email.send(fail_silently=False)
-
-        messages.success(request, "You successfully signed up, thanks a lot! A confirmation email has been sent.")
-
-    return redirect("match_list")
-
 class OfferListView(ListView):
     model = Offer
     template_name = "offer_list.html"
     context_object_name = "offers"
-    queryset = Offer.objects.order_by("-created_at")
+    page_size = 25
+    # "closed" groups every status an offer can end up in
+    STATUS_FILTERS = {
+        "open": ["open"],
+        "closed": ["accepted", "completed", "cancelled"],
+    }
+
+    async def get(self, request, *args, **kwargs):
+        await _auser(request)
+        self.object_list = self.get_queryset()
+        offers, next_cursor = await akeyset_page(
+            self.object_list, ("-created_at", "-id"), request.GET.get("after"), self.page_size
+        )
+        context = self.get_context_data(object_list=offers)
+        context["next_query"] = None
+        if next_cursor:
+            params = request.GET.copy()
+            params["after"] = next_cursor
+            context["next_query"] = params.urlencode()
+        return self.render_to_response(context)
 
     def get_queryset(self):
-        queryset = Offer.objects.all().order_by("-created_at")
+        # everything the cards print, in one joined query
+        queryset = Offer.objects.select_related("user", "slot__match__home_team", "slot__volunteer")
         status = self.request.GET.get("status", "open")
         my_offers = self.request.GET.get("my_offers") == "on"
 
         if status != "all":
-            queryset = queryset.filter(status=status)
+            queryset = queryset.filter(status__in=self.STATUS_FILTERS.get(status, [status]))
         if my_offers and self.request.user.is_authenticated:
             queryset = queryset.filter(user=self.request.user)
         return queryset
@@ -185,41 +294,84 @@ class OfferCreateView(CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # a new trade offer may close a swap with offers already waiting
+        if self.object.type == "trade" and any(self.object.pk in offer_ids for offer_ids in match_trades()):
+            messages.success(self.request, "Your trade offer was matched right away, check your new slot.")
+        return response
     
 @login_required
-def accept_offer(request, offer_id):
-    offer = get_object_or_404(Offer, id=offer_id, status="open")
-    user = request.user
-    profile, _ = Profile.objects.get_or_create(user=user)
-    user_team = profile.home_team
-    user_slots = VolunteerSlot.objects.filter(
-        match=offer.slot.match, volunteer=user
-    )
-
-    if offer.type == "trade":
-        if user_team and (offer.slot.match.home_team == user_team or offer.slot.match.guest_team == user_team):
-            messages.error(request, "Can't accept, you are playing!")
-            return redirect("offer_list")
-        if user_slots.exists():
-            messages.error(request, "You already volunteer for this match.")
-            return redirect("offer_list")
-        else:
-            # Swap volunteers between slots
-            offerer_slot = offer.slot
-            offerer_slot.volunteer = user
-            offerer_slot.save()
-
-    elif offer.type == "time":
-        if not user_slots.exists():
-            messages.error(request, "You must have a slot in this match to accept the offer.")
-            return redirect("offer_list")
-        else:
-            # Accepter takes the slot, offerer slot becomes open
-            offer.slot.volunteer = user
-            offer.slot.save()
-
-    offer.status = "closed"
-    offer.save()
-    messages.success(request, "Offer accepted and slots updated.")
+async def accept_offer(request, offer_id):
+    user = await _auser(request)
+    try:
+        await sync_to_async(services.accept_offer)(user, offer_id)
+    except OfferUnavailable as exc:
+        messages.error(request, str(exc))
+    else:
+        messages.success(request, "Offer accepted and slots updated.")
     return redirect("offer_list")
+
+
+def _calendar_response(request, feed, cache_control):
+    body, etag, last_modified = feed
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(body, content_type="text/calendar; charset=utf-8")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def user_calendar(request, token):
+    # calendar clients can't log in, the signed token in the URL identifies the user
+    user_id = user_id_from_token(token)
+    if user_id is None:
+        raise Http404("Unknown calendar")
+    return _calendar_response(request, user_feed(user_id), "private, max-age=300")
+
+
+def team_calendar(request, team_id):
+    return _calendar_response(request, team_feed(team_id), "public, max-age=300")
+
+
+async def live_events(request):
+    """Server-sent events: slot and offer changes as they are committed (see core.events)."""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live events need the ASGI server.", status=501, content_type="text/plain")
+    try:
+        last_id = int(request.headers["Last-Event-ID"])
+    except (KeyError, ValueError):
+        last_id = None
+    response = StreamingHttpResponse(events.stream(last_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # no proxy buffering
+    return response
+
+
+@staff_member_required
+def request_metrics(request):
+    """Rolling per-view timings of this process, for staff."""
+    return JsonResponse(stats.summary())
+
+
+@staff_member_required
+def cache_metrics(request):
+    """Cache hits and misses of this process per kind of cached value, for staff."""
+    return JsonResponse(cache_stats.summary())
+
+
+@staff_member_required
+def roster_export(request):
+    """The volunteer roster as a CSV download; ?from=, ?until= (YYYY-MM-DD) and ?team= narrow it."""
+    try:
+        start = date.fromisoformat(request.GET["from"]) if request.GET.get("from") else None
+        until = date.fromisoformat(request.GET["until"]) if request.GET.get("until") else None
+    except ValueError:
+        return HttpResponse("from and until must be YYYY-MM-DD dates.", status=400, content_type="text/plain")
+    slots = roster_slots(start, until, request.GET.get("team"))
+    # under ASGI a sync iterator would be read to the end before the first byte goes out
+    lines = aroster_csv(slots) if isinstance(request, ASGIRequest) else roster_csv(slots)
+    response = StreamingHttpResponse(lines, content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = 'attachment; filename="roster.csv"'
+    return response